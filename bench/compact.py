@@ -0,0 +1,106 @@
+#! /usr/bin/env python
+# Memory used by symbol tables, with compact CStruct objects (fields in
+# __slots__) and with the same classes without slots (fields in __dict__)
+# Usage: python bench/compact.py [number_of_symbols]
+
+import os, sys, struct, gc
+__dir__ = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(1, os.path.abspath(__dir__+'/..'))
+
+try:
+    import tracemalloc
+except ImportError:
+    sys.stderr.write("tracemalloc is needed, python >= 3.4\n")
+    sys.exit(1)
+
+from elfesteem import elf, elf_init, pe, pe_init
+from elfesteem.strpatchwork import StrPatchwork
+from elfesteem.cstruct import data_null, data_empty
+
+def dict_mode(cls):
+    # Same class, but without slots for the fields
+    if not getattr(cls, '_compact', False):
+        return cls
+    dct = dict(cls.__dict__)
+    for name in dct.pop('__slots__', ()):
+        del dct[name]
+    dct['_compact'] = False
+    bases = tuple([dict_mode(b) for b in cls.__bases__])
+    return type(cls)(cls.__name__, bases, dct)
+
+def measure(parse):
+    gc.collect()
+    tracemalloc.start()
+    obj = parse()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, size
+
+def elf_with_symbols(n):
+    e = elf_init.ELF()
+    strtab = e.getsectionbyname('.strtab')
+    strtab.content = StrPatchwork(data_null + data_null.join(
+        [ ('sym%d' % i).encode('latin1') for i in range(n) ]) + data_null)
+    symtab = e.getsectionbyname('.symtab')
+    syms = []
+    off = 1
+    for i in range(n):
+        syms.append(struct.pack('<IIIBBH', off, 0x1000+16*i, 16, 0x12, 0, 1))
+        off += len('sym%d' % i) + 1
+    symtab.content = StrPatchwork(data_empty.join(syms))
+    return e.pack()
+
+def coff_with_symbols(n):
+    # i386 COFF, an empty section, n symbols with a short name
+    c = [ struct.pack('<HHIIIHH', pe.IMAGE_FILE_MACHINE_I386, 1, 0, 60, n, 0, 0),
+          struct.pack('<8sIIIIIIHHI', '.text'.encode('latin1'),
+                      0, 0, 0, 0, 0, 0, 0, 0, 0x60000020) ]
+    for i in range(n):
+        c.append(struct.pack('<8sIHHBB', ('s%d' % i).encode('latin1'),
+                             16*i, 1, 0x20, 2, 0))
+    c.append(struct.pack('<I', 4))
+    return data_empty.join(c)
+
+def bench_elf(n):
+    data = elf_with_symbols(n)
+    def parse():
+        e = elf_init.ELF(data)
+        # Symbols are decoded when they are accessed
+        e.getsectionbyname('.symtab').symtab[:]
+        return e
+    res = {}
+    for mode in ('dict', 'compact'):
+        Sym32, Sym64 = elf.Sym32, elf.Sym64
+        if mode == 'dict':
+            elf.Sym32, elf.Sym64 = dict_mode(Sym32), dict_mode(Sym64)
+        try:
+            e, res[mode] = measure(parse)
+        finally:
+            elf.Sym32, elf.Sym64 = Sym32, Sym64
+        assert len(e.getsectionbyname('.symtab').symtab) == n
+    return res
+
+def bench_coff(n):
+    data = coff_with_symbols(n)
+    res = {}
+    for mode in ('dict', 'compact'):
+        CoffSymbol = pe.CoffSymbols._cls
+        if mode == 'dict':
+            pe.CoffSymbols._cls = dict_mode(CoffSymbol)
+        try:
+            e, res[mode] = measure(lambda: pe_init.Coff(data))
+        finally:
+            pe.CoffSymbols._cls = CoffSymbol
+        assert len(e.Symbols) == n
+    return res
+
+if __name__ == '__main__':
+    n = 100000
+    if len(sys.argv) > 1: n = int(sys.argv[1])
+    for name, bench in (('elf_init.SymTable', bench_elf),
+                        ('pe.CoffSymbols', bench_coff)):
+        res = bench(n)
+        print("%-18s %d symbols: dict %6.1f MB, compact %6.1f MB (%d%%)" % (
+            name, n, res['dict']/1e6, res['compact']/1e6,
+            100*res['compact']//res['dict']))
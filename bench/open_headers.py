@@ -0,0 +1,31 @@
+#! /usr/bin/env python
+# Time to open an ELF file mapped in memory and read fields of its
+# header, and time to also use its section headers, which are only decoded when they are
+# used; e.g. for an object file with many sections (-ffunction-sections).
+# Usage: python bench/open_headers.py [file]
+
+import os, sys, time
+__dir__ = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(1, os.path.abspath(__dir__+'/..'))
+
+from elfesteem.elf_init import ELF, log
+import logging
+log.setLevel(logging.ERROR)
+
+def measure(name, f, count):
+    t = time.time()
+    for _ in range(count):
+        f()
+    t = (time.time() - t) / count
+    print("%-28s %10.3f ms" % (name, t*1000))
+
+if __name__ == "__main__":
+    path = __dir__+'/../tests/binary_input/elf64_small.out'
+    if len(sys.argv) > 1:
+        path = sys.argv[1]
+    e = ELF.from_path(path)
+    print("%d sections, %d segments" % (len(e.sh.shlist), len(e.ph.phlist)))
+    measure("open, read Ehdr fields",
+            lambda: ELF.from_path(path).Ehdr.machine, 20)
+    measure("open, read section headers",
+            lambda: ELF.from_path(path).sh.shlist[-1].sh.name, 5)
@@ -55,6 +55,9 @@ class CBase(object):
       start:   offset where to start parsing the content
       sex and wsize: endianess and wordsize
     """
+    # Attributes that all objects have; subclasses that don't define
+    # __slots__ have a __dict__ for other attributes
+    __slots__ = ('parent', 'sex', 'wsize', '_size')
     def __init__(self, *args, **kargs):
         if not 'parent' in kargs:
             # Old API of elfesteem
@@ -104,6 +107,34 @@ class CBase(object):
         if hasattr(self, '_align'):
             s += '\0' * ((self._align - o._size % self._align) % self._align)
         return s
+    def pack_into(self, buf, off):
+        # Writes the packed object in the bytearray 'buf' at offset 'off',
+        # and returns the offset of its end. Subclasses that can write
+        # in place without building intermediate bytes redefine it.
+        s = self.pack()
+        buf[off:off+len(s)] = s
+        return off+len(s)
+    def _pack_align_into(self, o, buf, off):
+        off = o.pack_into(buf, off)
+        if hasattr(self, '_align'):
+            pad = (self._align - o._size % self._align) % self._align
+            buf[off:off+pad] = data_null*pad
+            off += pad
+        return off
+
+_redefined = {}
+def _redefines(cls, base, name):
+    # True if the method 'name' of 'cls' is not the one of 'base'
+    key = (cls, base, name)
+    if not key in _redefined:
+        _redefined[key] = False
+        for c in cls.__mro__:
+            if c is base:
+                break
+            if name in c.__dict__:
+                _redefined[key] = True
+                break
+    return _redefined[key]
 
 class CString(CBase):
     def set_value(self, s):
@@ -139,9 +170,115 @@ class CStruct_metaclass(type):
                     lambda self,fname=fname:   self.getf(fname),
                     lambda self,v,fname=fname: self.setf(fname,v),
                     None)
+        # Each class has its own cache of layouts, because subclasses
+        # may define other _fields
+        dct['_layouts'] = {}
+        # Compact classes store their fields in slots, their objects
+        # have no __dict__; other slots can be given in __slots__
+        compact = dct.get('_compact', None)
+        if compact is None:
+            compact = [b for b in bases if getattr(b, '_compact', False)]
+        if compact:
+            slots = set()
+            for b in bases:
+                for c in b.__mro__:
+                    slots.update(c.__dict__.get('__slots__', ()))
+            dct['__slots__'] = tuple(dct.get('__slots__', ())) + \
+                tuple([ '_0'+fname
+                for fname, _ in dct.get('_fields', ())
+                if not '_0'+fname in slots ])
         return type.__new__(cls, name, bases, dct)
 
-CStruct_base = CStruct_metaclass('CStruct_base', (CBase,), {})
+class CStructLayout(object):
+    """
+    Everything that can be deduced from _fields, for a given CStruct
+    class, endianess and wordsize; it is computed only once and shared
+    by all objects of this class.
+      packstring: format of the fixed-size fields, for the struct module
+      struct:     struct.Struct object compiled from packstring
+      size:       length of the fixed-size fields
+      names:      names of the fixed-size fields
+      attrs:      attributes where the values of these fields are stored
+      defaults:   default values of these fields
+      opt:        pairs (field_name, class) of the optional fields
+      format:     type of each field, for the struct module
+      fields:     for each fixed-size field, its offset and a struct.Struct
+                  object to decode it alone
+      plain:      True if the class does not redefine _initialize or unpack,
+                  then its objects can be decoded in bulk
+      packs:      True if the class does not redefine pack, then its
+                  objects can be written in place by pack_into
+    """
+    def __init__(self, cls, sex, wsize):
+        self.format = {}
+        pstr = []
+        for fname, ftype in cls._fields:
+            if not isinstance(ftype, str):
+                ftype = ''
+            elif re.match(r'\d+s', ftype):
+                pass
+            elif ftype == "ptr":
+                ftype = size2type[wsize]
+            elif ftype in type_size:
+                ftype = type_size[ftype]
+            else:
+                raise ValueError("unkown CStruct type", ftype)
+            self.format[fname] = ftype
+            pstr.append(ftype)
+        self.packstring = sex + cls._packformat + "".join(pstr)
+        self.struct = struct.Struct(self.packstring)
+        self.size = self.struct.size
+        self.names = tuple([x[0] for x in cls._fields if isinstance(x[1],str)])
+        self.attrs = tuple(['_0'+x for x in self.names])
+        self.defaults = []
+        for fname in self.names:
+            if self.format[fname].endswith('s'): self.defaults.append(data_empty)
+            else:                                self.defaults.append(0)
+        self.defaults = tuple(self.defaults)
+        self.opt = tuple([x for x in cls._fields if not isinstance(x[1],str)])
+        self.fields = {}
+        prefix = sex + cls._packformat
+        for idx, fname in enumerate(self.names):
+            ftype = prefix + self.format[fname]
+            offset = struct.calcsize(prefix + "".join(pstr[:idx+1])) \
+                   - struct.calcsize(ftype)
+            self.fields[fname] = (offset, struct.Struct(ftype))
+        self.plain = True
+        for c in cls.__mro__:
+            if c is CStruct:
+                break
+            if 'unpack' in c.__dict__ or '_initialize' in c.__dict__:
+                self.plain = False
+                break
+        self.packs = not _redefines(cls, CStruct, 'pack')
+    def numpy_dtype(self, itemsize=None):
+        """
+        Description of the fixed-size fields, to be given to numpy.dtype
+        to decode an array of structures with numpy.frombuffer; numpy
+        is not imported here. 'itemsize' is the distance between two
+        structures, by default their size.
+        """
+        sex = self.packstring[:1]
+        if not sex in '<>!=@': sex = '='
+        if sex == '!': sex = '>'
+        if sex == '@': sex = '='
+        formats = []
+        for fname in self.names:
+            ftype = self.format[fname]
+            if ftype.endswith('s'):
+                formats.append('S' + ftype[:-1])
+            else:
+                kind = {True: 'u', False: 'i'}[ftype.isupper()]
+                formats.append('%s%s%d' % (sex, kind,
+                               struct.calcsize(sex+ftype)))
+        if itemsize is None:
+            itemsize = self.size
+        return { 'names':   list(self.names),
+                 'formats': formats,
+                 'offsets': [self.fields[fname][0] for fname in self.names],
+                 'itemsize': itemsize }
+
+CStruct_base = CStruct_metaclass('CStruct_base', (CBase,), {'__slots__': ()})
 class CStruct(CStruct_base):
     """
     The class CStruct is inherited by classes that simply
@@ -161,7 +298,16 @@ class CStruct(CStruct_base):
     Field types:
       basic types with fixed size (u08, ..., 16s)
       wsize-dependent type (ptr)
+
+    Compact classes:
+      if _compact is True, the objects of this class and of its
+      subclasses have no __dict__, the field values are in __slots__;
+      it saves memory for structures that are parsed in large numbers,
+      but other attributes can only be added if the class lists them
+      in __slots__
     """
+    __slots__ = ('_layout',)
+    _compact = False
 
     def getf(self, fname):
         return getattr(self,'_0'+fname)
@@ -170,71 +316,90 @@ class CStruct(CStruct_base):
 
     _packformat = ""
 
+    def _get_layout(cls, sex, wsize):
+        try:
+            return cls._layouts[(sex, wsize)]
+        except KeyError:
+            layout = CStructLayout(cls, sex, wsize)
+            cls._layouts[(sex, wsize)] = layout
+            return layout
+    _get_layout = classmethod(_get_layout)
+
     def _parent_parse(self, kargs):
         CBase._parent_parse(self, kargs)
         if self._packformat:
             self.sex = ""
-        self._format = {}
-        pstr = []
-        for fname, ftype in self._fields:
-            if not isinstance(ftype, str):
-                ftype = ''
-            elif re.match(r'\d+s', ftype):
-                pass
-            elif ftype == "ptr":
-                ftype = size2type[self.wsize]
-            elif ftype in type_size:
-                ftype = type_size[ftype]
-            else:
-                raise ValueError("unkown CStruct type", ftype)
-            self._format[fname] = ftype
-            pstr.append(ftype)
-        self._packstring =  self.sex + self._packformat+"".join(pstr)
-        self._names = [x[0] for x in self._fields if isinstance(x[1],str)]
-        self._opt = [x for x in self._fields if not isinstance(x[1],str)]
+        self._layout = self._get_layout(self.sex, self.wsize)
+    # For API compatibility with previous versions of elfesteem
+    _format     = property(lambda _: _._layout.format)
+    _packstring = property(lambda _: _._layout.packstring)
+    _names      = property(lambda _: _._layout.names)
+    _opt        = property(lambda _: _._layout.opt)
 
     def unpack(self, c, o):
-        self._size = struct.calcsize(self._packstring)
+        layout = self._layout
+        self._size = layout.size
         s = c[o:o+self._size]
-        s += data_null*(self._size-len(s))
-        disas = struct.unpack(self._packstring, s)
-        for n,v in zip(self._names,disas):
+        if len(s) < self._size:
+            s += data_null*(self._size-len(s))
+        for n,v in zip(layout.attrs, layout.struct.unpack(s)):
             setattr(self, n, v)
         # If the last fields are optional data, their types are a class
-        for fname, fclass in self._opt:
+        for fname, fclass in layout.opt:
             v = fclass(parent=self, content=c, start=o+self._size)
             self._size += self._size_align(v)
             self.setf(fname, v)
 
     def _initialize(self):
-        self._size = struct.calcsize(self._packstring)
-        for f in self._names:
-            # Default values
-            if self._format[f].endswith('s'): self.setf(f,data_empty)
-            else:                             self.setf(f,0)
-        for fname, fclass in self._opt:
+        layout = self._layout
+        self._size = layout.size
+        # Default values
+        for n,v in zip(layout.attrs, layout.defaults):
+            setattr(self, n, v)
+        for fname, fclass in layout.opt:
             v = fclass(parent=self)
             self._size += self._size_align(v)
             self.setf(fname, v)
 
     def update(self, **kargs):
-        for f in [f for f in kargs if f in self._names]:
-            self.setf(f,kargs[f])
-        for fname, fclass in self._opt:
+        names = self._layout.names
+        for f in kargs:
+            if f in names:
+                self.setf(f,kargs[f])
+        for fname, fclass in self._layout.opt:
             v = self.getf(fname)
             self._size -= self._size_align(v)
             v.update(**kargs)
             self._size += self._size_align(v)
 
+    def _field_values(self):
+        return [getattr(self, x) for x in self._layout.attrs]
     def pack(self):
-        fields = [getattr(self, x) for x in self._names]
-        s = struct.pack(self._packstring, *fields)
-        for fname, fclass in self._opt:
-            s += self._pack_align(self.getf(fname))
+        layout = self._layout
+        if layout.opt:
+            # The optional fields are written in place, in one buffer
+            buf = bytearray(self.bytelen)
+            CStruct._pack_fields_into(self, buf, 0)
+            return bytes(buf)
+        s = layout.struct.pack(*self._field_values())
         if self.bytelen != len(s):
             raise ValueError("Inconsistent size %d != %d for %r"
                 % (self.bytelen,len(s), self.__class__.__name__))
         return s
+    def pack_into(self, buf, off):
+        if not self._layout.packs:
+            return CBase.pack_into(self, buf, off)
+        return self._pack_fields_into(buf, off)
+    def _pack_fields_into(self, buf, off):
+        layout = self._layout
+        layout.struct.pack_into(buf, off, *self._field_values())
+        end = off + layout.size
+        for fname, fclass in layout.opt:
+            end = self._pack_align_into(self.getf(fname), buf, end)
+        if self.bytelen != end-off:
+            raise ValueError("Inconsistent size %d != %d for %r"
+                % (self.bytelen,end-off, self.__class__.__name__))
+        return end
 
     def __str__(self):
         raise AttributeError("Use pack() instead of str()")
@@ -257,6 +422,7 @@ class CStruct(CStruct_base):
 class CStructWithStrTable(CStruct):
     # The attribute 'name' is computed from an integer index 'name_idx'
     # and a link to the string table 'strtab'
+    __slots__ = ()
     def get_name(self):
         return self.strtab.get_name(self.name_idx)
     def set_name(self, name):
@@ -299,7 +465,13 @@ class CArray(CArray_base):
       append adds an element to the array
       _array is the whole array
       _last is the terminating element, if count is not defined
+
+    When count is defined and _cls is a CStruct with only fixed-size
+    fields and the default unpack method, count() is evaluated once,
+    the whole array is decoded in one pass, and the element objects
+    are only created when they are accessed.
     """
+    _values = None # Decoded fields of the elements not yet created
     def _initialize(self):
         self._array = [] # Elements of the array
         self._size  = 0
@@ -311,21 +483,116 @@ class CArray(CArray_base):
             self._last  = self._cls(parent=self)
             self._size  += self._size_align(self._last)
 
+    def _get_array(self):
+        if self._values is not None:
+            for idx in range(len(self._elts)):
+                if self._elts[idx] is None:
+                    self._elts[idx] = self._make_element(idx)
+            self._values = None
+        return self._elts
+    def _set_array(self, value):
+        self._values = None
+        self._elts = value
+    _array = property(_get_array, _set_array)
+
     def pack(self):
-        s = data_empty.join([self._pack_align(o) for o in self._array])
-        if hasattr(self, '_last'): s += self._pack_align(self._last)
-        if self._size != len(s):
-            raise ValueError("Inconsistent size %d != %d for %r"
-                % (self._size,len(s), self.__class__.__name__))
-        return s
+        # The elements are written in place, in one buffer; its size
+        # is computed from the current elements, that may have changed
+        # size after they were appended
+        buf = bytearray(self._elements_size())
+        CArray._pack_elements_into(self, buf, 0)
+        return bytes(buf)
+    def pack_into(self, buf, off):
+        if _redefines(self.__class__, CArray, 'pack') \
+                or self._elements_size() != self._size:
+            return CBase.pack_into(self, buf, off)
+        return self._pack_elements_into(buf, off)
+    def _elements_size(self):
+        size = 0
+        if self._values is None:
+            for elt in self._array:
+                size += self._size_align(elt)
+        else:
+            for elt in self._elts:
+                if elt is None: size += self._fixed_struct.size
+                else:           size += self._size_align(elt)
+        if hasattr(self, '_last'):
+            size += self._size_align(self._last)
+        return size
+    def _pack_elements_into(self, buf, off):
+        end = off
+        if self._values is None:
+            for elt in self._array:
+                end = self._pack_align_into(elt, buf, end)
+        else:
+            st = self._fixed_struct
+            for elt, v in zip(self._elts, self._values):
+                if elt is None:
+                    st.pack_into(buf, end, *v)
+                    end += st.size
+                else:
+                    end = self._pack_align_into(elt, buf, end)
+        if hasattr(self, '_last'):
+            end = self._pack_align_into(self._last, buf, end)
+        return end
 
     def stop(self, elt):
         return elt.pack() == self._last.pack()
 
+    def _bulk_layout(self, cls):
+        # Returns the layout of the elements if they can be decoded
+        # in bulk, else None
+        if not (isinstance(cls, type) and issubclass(cls, CStruct)):
+            return None
+        if cls._packformat: sex = ""
+        else:               sex = self.sex
+        layout = cls._get_layout(sex, self.wsize)
+        if not layout.plain or layout.opt or layout.size == 0:
+            return None
+        return layout
+
+    def _unpack_fixed(self, c, o, cls, layout):
+        pad = 0
+        if hasattr(self, '_align'):
+            pad = (self._align - layout.size % self._align) % self._align
+        if pad: st = struct.Struct(layout.packstring + '%dx' % pad)
+        else:   st = layout.struct
+        o += self._size
+        # Same number of elements as when parsing them one by one:
+        # we stop at the end of the content, the last one may be padded
+        count = min(self.count(), (len(c) - o + st.size - 1) // st.size)
+        count = max(0, count)
+        s = c[o:o+count*st.size]
+        if len(s) < count*st.size:
+            s += data_null*(count*st.size-len(s))
+        if hasattr(st, 'iter_unpack'):
+            values = list(st.iter_unpack(s))
+        else:
+            values = [st.unpack_from(s, pos)
+                      for pos in range(0, len(s), st.size)]
+        self._elts = [None] * count
+        self._values = values
+        self._fixed_cls = cls
+        self._fixed_layout = layout
+        self._fixed_struct = st
+        self._size += count*st.size
+
+    def _make_element(self, idx):
+        elt = self._fixed_cls(parent=self)
+        for n,v in zip(self._fixed_layout.attrs, self._values[idx]):
+            setattr(elt, n, v)
+        elt._size = self._fixed_layout.size
+        return elt
+
     def unpack(self, c, o):
         if o is None: return
         self._off = o
         if hasattr(self, 'count'):
+            cls = self._cls
+            layout = self._bulk_layout(cls)
+            if layout is not None:
+                self._unpack_fixed(c, o, cls, layout)
+                return
             # self.count() is recomputed each time
             # This enables complicated conditions for array termination
             idx = 0
@@ -349,10 +616,23 @@ class CArray(CArray_base):
             self._size += pos
 
     def __getitem__(self, item):
-        return self._array[item]
+        if self._values is None:
+            return self._array[item]
+        if isinstance(item, slice):
+            return [self[idx] for idx in range(*item.indices(len(self)))]
+        elt = self._elts[item]
+        if elt is None:
+            if item < 0: item += len(self._elts)
+            elt = self._make_element(item)
+            self._elts[item] = elt
+        return elt
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
 
     def __len__(self):
-        return len(self._array)
+        return len(self._elts)
 
     def append(self, obj):
         self._array.append(obj)
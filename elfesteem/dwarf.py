@@ -0,0 +1,581 @@
+#! /usr/bin/env python
+
+# DWARF debugging information: line number tables of .debug_line,
+# versions 2 to 5, to find the source file and line of an address.
+
+import sys
+import struct
+import array
+from bisect import bisect_right
+
+from elfesteem import elf
+from elfesteem.cstruct import data_null, data_empty, bytes_to_name, name_to_bytes
+
+# Standard opcodes
+DW_LNS_copy               = 1
+DW_LNS_advance_pc         = 2
+DW_LNS_advance_line       = 3
+DW_LNS_set_file           = 4
+DW_LNS_set_column         = 5
+DW_LNS_negate_stmt        = 6
+DW_LNS_set_basic_block    = 7
+DW_LNS_const_add_pc       = 8
+DW_LNS_fixed_advance_pc   = 9
+DW_LNS_set_prologue_end   = 10
+DW_LNS_set_epilogue_begin = 11
+DW_LNS_set_isa            = 12
+
+# Extended opcodes
+DW_LNE_end_sequence       = 1
+DW_LNE_set_address        = 2
+DW_LNE_define_file        = 3
+DW_LNE_set_discriminator  = 4
+
+# Smallest unit: unit_length, version, header_length, then five bytes
+# up to opcode_base, in DWARF 2
+UNIT_MIN_SIZE = 15
+
+# Content of the directory and file name entries (DWARF 5)
+DW_LNCT_path              = 1
+DW_LNCT_directory_index   = 2
+DW_LNCT_timestamp         = 3
+DW_LNCT_size              = 4
+DW_LNCT_MD5               = 5
+
+# Forms of these entries
+DW_FORM_block             = 0x09
+DW_FORM_data1             = 0x0b
+DW_FORM_data2             = 0x05
+DW_FORM_data4             = 0x06
+DW_FORM_data8             = 0x07
+DW_FORM_data16            = 0x1e
+DW_FORM_string            = 0x08
+DW_FORM_strp              = 0x0e
+DW_FORM_line_strp         = 0x1f
+DW_FORM_udata             = 0x0f
+DW_FORM_strx              = 0x1a
+DW_FORM_strx1             = 0x25
+DW_FORM_strx2             = 0x26
+DW_FORM_strx3             = 0x27
+DW_FORM_strx4             = 0x28
+
+# Rows are stored in arrays; python2 has no 'Q', but its 'L' has 64 bits
+# on 64-bit Unix platforms
+try:
+    array.array('Q')
+    ADDR_TYPE = 'Q'
+except ValueError:
+    ADDR_TYPE = 'L'
+
+def uleb128(d, pos):
+    # Value and position after an unsigned LEB128 in the bytearray 'd'
+    res, shift = 0, 0
+    while True:
+        b = d[pos]
+        pos += 1
+        res |= (b & 0x7f) << shift
+        if b < 0x80:
+            return res, pos
+        shift += 7
+
+def sleb128(d, pos):
+    res, shift = 0, 0
+    while True:
+        b = d[pos]
+        pos += 1
+        res |= (b & 0x7f) << shift
+        shift += 7
+        if b < 0x80:
+            if b & 0x40:
+                res -= 1 << shift
+            return res, pos
+
+def cstring(d, pos):
+    # NUL-terminated string and position after it
+    end = d.find(data_null, pos)
+    if end == -1:
+        raise ValueError("Unterminated string at offset %#x" % pos)
+    return bytes_to_name(bytes(d[pos:end])), end+1
+
+def find_sequence(starts, ends, max_ends, ad):
+    # Index of the sequence [start, end) that contains 'ad', or None;
+    # the sequences are sorted by start, and max_ends[i] is the greatest
+    # end of the sequences [0:i+1], to find a sequence that contains 'ad'
+    # when it is overlapped by sequences starting after it (e.g. the
+    # sequences of functions removed by --gc-sections, moved at 0).
+    # If several sequences contain 'ad', the one starting last is found.
+    i = bisect_right(starts, ad) - 1
+    while i >= 0 and max_ends[i] > ad:
+        if ends[i] > ad:
+            return i
+        i -= 1
+    return None
+
+def max_ends(ends):
+    # Running maximum of 'ends', for find_sequence()
+    res, m = [], 0
+    for end in ends:
+        if end > m: m = end
+        res.append(m)
+    return res
+
+def join_path(directory, name):
+    if not directory or name.startswith('/'):
+        return name
+    return directory + '/' + name
+
+class LineTable(object):
+    """
+    Line number table of one compile unit, decoded from its line number
+    program in .debug_line; the program is run without creating an
+    object per row, the rows are appended to three arrays, sorted by
+    address: 'addresses', 'files' (index in 'file_names') and 'lines'.
+    The last row of a sequence has file END: the addresses after it,
+    up to the next sequence, have no line.
+    'sequences' are the (start, end) addresses of the sequences, sorted,
+    and 'seq_rows' the (first, stop) indexes of their rows; sequences
+    may overlap, the rows are only sorted within a sequence.
+    """
+    END = 0xffffffff
+    def __init__(self):
+        self.offset = 0
+        self.version = 0
+        self.file_names = []
+        self.addresses = array.array(ADDR_TYPE)
+        self.files = array.array('I')
+        self.lines = array.array('I')
+        self.sequences = []
+        self.seq_rows = []
+        self._index()
+    def __len__(self):
+        return len(self.addresses)
+    def rows(self):
+        """ Generates (address, file name, line) of each row; None as
+        file name for the end of a sequence """
+        for ad, f, l in zip(self.addresses, self.files, self.lines):
+            yield ad, self.file_name(f), l
+    def file_name(self, idx):
+        if idx < len(self.file_names):
+            return self.file_names[idx] or None
+        return None
+    def _index(self):
+        self._starts = [ start for start, end in self.sequences ]
+        self._ends = [ end for start, end in self.sequences ]
+        self._max_ends = max_ends(self._ends)
+    def lookup(self, ad):
+        """ (file name, line) of the address 'ad', or None """
+        k = find_sequence(self._starts, self._ends, self._max_ends, ad)
+        if k is None:
+            return None
+        return self.lookup_sequence(k, ad)
+    def lookup_sequence(self, k, ad):
+        # Same as lookup(), in the k-th sequence, that contains 'ad'
+        first, stop = self.seq_rows[k]
+        i = bisect_right(self.addresses, ad, first, stop) - 1
+        if i < first or self.files[i] == self.END:
+            return None
+        return self.file_name(self.files[i]), self.lines[i]
+
+    def decode(cls, d, offset, sex='<', wsize=32, strings={}):
+        """
+        Decodes the unit at 'offset' in the bytearray 'd' (content of
+        .debug_line); returns the table and the offset of the next unit.
+        'strings' is the content of .debug_str and .debug_line_str, by
+        section name, for DWARF 5 file names.
+        """
+        self = cls()
+        self.offset = pos = offset
+        unpack_from = struct.unpack_from
+        length, = unpack_from(sex+'I', d, pos)
+        pos += 4
+        offsize, offtype = 4, 'I'
+        if length == 0xffffffff:
+            # 64-bit DWARF
+            length, = unpack_from(sex+'Q', d, pos)
+            pos += 8
+            offsize, offtype = 8, 'Q'
+        end = pos + length
+        if end > len(d):
+            raise ValueError("Line number program at %#x is truncated" % offset)
+        self.version, = unpack_from(sex+'H', d, pos)
+        pos += 2
+        if not 2 <= self.version <= 5:
+            raise ValueError("Line number program at %#x has version %d"
+                             % (offset, self.version))
+        address_size = wsize//8
+        if self.version >= 5:
+            address_size = d[pos]
+            pos += 2 # address_size, segment_selector_size
+        header_length, = unpack_from(sex+offtype, d, pos)
+        pos += offsize
+        program = pos + header_length
+        min_length = d[pos]
+        pos += 1
+        max_ops = 1
+        if self.version >= 4:
+            max_ops = d[pos] or 1
+            pos += 1
+        line_base, line_range, opcode_base = d[pos+1], d[pos+2], d[pos+3]
+        if line_base >= 0x80:
+            line_base -= 0x100
+        pos += 4
+        std_lengths = d[pos:pos+opcode_base-1]
+        pos += opcode_base-1
+
+        if self.version < 5:
+            # File 0 does not exist, directory 0 is the compilation one
+            dirs = [ '' ]
+            while d[pos]:
+                name, pos = cstring(d, pos)
+                dirs.append(name)
+            pos += 1
+            self.file_names = [ '' ]
+            while d[pos]:
+                name, pos = cstring(d, pos)
+                dir_idx, pos = uleb128(d, pos)
+                _, pos = uleb128(d, pos) # modification time
+                _, pos = uleb128(d, pos) # length
+                self.file_names.append(join_path(
+                    dir_idx < len(dirs) and dirs[dir_idx] or '', name))
+        else:
+            fixed = { DW_FORM_data1: 'B', DW_FORM_data2: 'H',
+                      DW_FORM_data4: 'I', DW_FORM_data8: 'Q' }
+            skipped = { DW_FORM_data16: 16, DW_FORM_strx1: 1,
+                        DW_FORM_strx2: 2, DW_FORM_strx3: 3, DW_FORM_strx4: 4 }
+            def read_form(form, pos):
+                if form == DW_FORM_string:
+                    return cstring(d, pos)
+                if form in (DW_FORM_line_strp, DW_FORM_strp):
+                    off, = unpack_from(sex+offtype, d, pos)
+                    s = strings.get({DW_FORM_line_strp: '.debug_line_str',
+                                     DW_FORM_strp: '.debug_str'}[form])
+                    if s is None or off >= len(s):
+                        return None, pos+offsize
+                    return cstring(s, off)[0], pos+offsize
+                if form == DW_FORM_udata:
+                    return uleb128(d, pos)
+                if form in fixed:
+                    value, = unpack_from(sex+fixed[form], d, pos)
+                    return value, pos+struct.calcsize(fixed[form])
+                # Blocks, MD5, and string indexes, which would need
+                # .debug_str_offsets, are not decoded
+                if form in skipped:
+                    return None, pos+skipped[form]
+                if form == DW_FORM_block:
+                    size, pos = uleb128(d, pos)
+                    return None, pos+size
+                if form == DW_FORM_strx:
+                    return None, uleb128(d, pos)[1]
+                raise ValueError("Line number program at %#x has form %#x"
+                                 % (offset, form))
+            def entries(pos):
+                count = d[pos]
+                pos += 1
+                formats = []
+                for _ in range(count):
+                    content, pos = uleb128(d, pos)
+                    form, pos = uleb128(d, pos)
+                    formats.append((content, form))
+                count, pos = uleb128(d, pos)
+                res = []
+                for _ in range(count):
+                    path, dir_idx = '', 0
+                    for content, form in formats:
+                        value, pos = read_form(form, pos)
+                        if content == DW_LNCT_path:
+                            path = value or ''
+                        elif content == DW_LNCT_directory_index:
+                            dir_idx = value
+                    res.append((path, dir_idx))
+                return res, pos
+            dirs, pos = entries(pos)
+            dirs = [ path for path, _ in dirs ]
+            files, pos = entries(pos)
+            self.file_names = [ join_path(
+                dir_idx < len(dirs) and dirs[dir_idx] or '', path)
+                for path, dir_idx in files ]
+
+        self._run(d, program, end, sex, address_size, min_length, max_ops,
+                  line_base, line_range, opcode_base, std_lengths)
+        return self, end
+    decode = classmethod(decode)
+
+    def _run(self, d, pos, end, sex, address_size, min_length, max_ops,
+             line_base, line_range, opcode_base, std_lengths):
+        # The state machine of the line number program, only the
+        # registers address, op_index, file and line are kept
+        END = self.END
+        add_address = self.addresses.append
+        add_file = self.files.append
+        add_line = self.lines.append
+        address_fmt = sex+{1: 'B', 2: 'H', 4: 'I', 8: 'Q'}.get(address_size, 'Q')
+        const_add = (255 - opcode_base) // line_range
+        seq_rows = [0] # First row of each sequence
+        address, op_index, file, line = 0, 0, 1, 1
+        while pos < end:
+            op = d[pos]
+            pos += 1
+            if op >= opcode_base:
+                op -= opcode_base
+                adv = op // line_range
+                if max_ops == 1:
+                    address += min_length * adv
+                else:
+                    op_index += adv
+                    address += min_length * (op_index // max_ops)
+                    op_index %= max_ops
+                line += line_base + op % line_range
+                add_address(address)
+                add_file(file)
+                add_line(line)
+            elif op == DW_LNS_advance_line:
+                adv, pos = sleb128(d, pos)
+                line += adv
+            elif op == DW_LNS_copy:
+                add_address(address)
+                add_file(file)
+                add_line(line)
+            elif op in (DW_LNS_advance_pc, DW_LNS_const_add_pc):
+                if op == DW_LNS_advance_pc:
+                    adv, pos = uleb128(d, pos)
+                else:
+                    adv = const_add
+                if max_ops == 1:
+                    address += min_length * adv
+                else:
+                    op_index += adv
+                    address += min_length * (op_index // max_ops)
+                    op_index %= max_ops
+            elif op == DW_LNS_set_file:
+                file, pos = uleb128(d, pos)
+            elif op == DW_LNS_fixed_advance_pc:
+                adv, = struct.unpack_from(sex+'H', d, pos)
+                pos += 2
+                address += adv
+                op_index = 0
+            elif op == 0:
+                length, pos = uleb128(d, pos)
+                following = pos + length
+                if length == 0:
+                    continue
+                op = d[pos]
+                if op == DW_LNE_end_sequence:
+                    add_address(address)
+                    add_file(END)
+                    add_line(line)
+                    seq_rows.append(len(self.addresses))
+                    address, op_index, file, line = 0, 0, 1, 1
+                elif op == DW_LNE_set_address:
+                    # The operand size is given by the length, it should
+                    # be address_size
+                    size = length - 1
+                    if size == address_size:
+                        address, = struct.unpack_from(address_fmt, d, pos+1)
+                    else:
+                        data = d[pos+1:following]
+                        if sex == '>':
+                            data = reversed(data)
+                        address = 0
+                        for i, c in enumerate(data):
+                            address |= c << (8*i)
+                    op_index = 0
+                elif op == DW_LNE_define_file:
+                    name, _ = cstring(d, pos+1)
+                    self.file_names.append(name)
+                pos = following
+            else:
+                # Other opcodes only change registers that are not kept,
+                # their operands are skipped
+                for _ in range(std_lengths[op-1]):
+                    _, pos = uleb128(d, pos)
+        self._sort(seq_rows)
+
+    def _sort(self, seq_rows):
+        # The sequences are sorted by address, e.g. because functions
+        # in different sections may be described in any order; rows
+        # after the last end_sequence are dropped
+        addresses = self.addresses
+        seqs = [ (addresses[seq_rows[i]], addresses[seq_rows[i+1]-1],
+                  seq_rows[i], seq_rows[i+1])
+                 for i in range(len(seq_rows)-1) ]
+        if seqs != sorted(seqs) or seq_rows[-1] != len(addresses):
+            seqs.sort()
+            for name in ('addresses', 'files', 'lines'):
+                old = getattr(self, name)
+                new = array.array(old.typecode)
+                for _, _, i, j in seqs:
+                    new.extend(old[i:j])
+                setattr(self, name, new)
+        self.sequences, self.seq_rows = [], []
+        pos = 0
+        for start, end, i, j in seqs:
+            self.sequences.append((start, end))
+            self.seq_rows.append((pos, pos+j-i))
+            pos += j-i
+        self._index()
+
+def section_data(s):
+    # Content of a section, decompressed if SHF_COMPRESSED
+    data = s.content.pack()
+    if not s.sh.flags & elf.SHF_COMPRESSED:
+        return data
+    if s.wsize == 32:
+        type, size, _ = struct.unpack(s.sex+'III', data[:12])
+        data = data[12:]
+    else:
+        type, _, size, _ = struct.unpack(s.sex+'IIQQ', data[:24])
+        data = data[24:]
+    if type != elf.ELFCOMPRESS_ZLIB:
+        raise ValueError("Section %r has compression type %d"
+                         % (s.sh.name, type))
+    import zlib
+    return zlib.decompress(data)
+
+class DebugLine(object):
+    """
+    Line number information of an ELF file, from its .debug_line
+    section: one LineTable per compile unit in 'units', and an index
+    of the sequences of all units, to find the source file and line of
+    an address in O(log n).
+    Relocations are not applied, this is meant for linked files.
+    The tables can be saved in a cache file, see cached().
+    """
+    def __init__(self, e=None):
+        self.units = []
+        if e is not None:
+            self.decode(e)
+    def decode(self, e):
+        sec = e.getsectionbyname('.debug_line')
+        if sec is None:
+            return
+        d = bytearray(section_data(sec))
+        strings = {}
+        for name in ('.debug_str', '.debug_line_str'):
+            s = e.getsectionbyname(name)
+            if s is not None:
+                strings[name] = bytearray(section_data(s))
+        self.decode_units(d, e.sex, e.wsize, strings)
+    def decode_units(self, d, sex='<', wsize=32, strings={}):
+        """
+        Decodes the units of 'd', content of .debug_line, see
+        LineTable.decode; zero unit lengths, and a tail too short to be
+        a unit, are padding, which is skipped.
+        """
+        pos = 0
+        while len(d) - pos >= UNIT_MIN_SIZE:
+            length, = struct.unpack_from(sex+'I', d, pos)
+            if length == 0:
+                pos += 4
+                continue
+            unit, pos = LineTable.decode(d, pos, sex, wsize, strings)
+            self.units.append(unit)
+        self._index()
+    def _index(self):
+        seqs = sorted([ (start, end, idx, k)
+                        for idx, unit in enumerate(self.units)
+                        for k, (start, end) in enumerate(unit.sequences) ])
+        self._starts = [ _[0] for _ in seqs ]
+        self._ends = [ _[1] for _ in seqs ]
+        self._max_ends = max_ends(self._ends)
+        self._units = [ _[2:] for _ in seqs ]
+    def __len__(self):
+        return sum([ len(unit) for unit in self.units ])
+    def lookup(self, ad):
+        """ (file name, line) of the address 'ad', or None """
+        i = find_sequence(self._starts, self._ends, self._max_ends, ad)
+        if i is None:
+            return None
+        idx, k = self._units[i]
+        return self.units[idx].lookup_sequence(k, ad)
+
+    # Cache file: the arrays are written as they are in memory, it can
+    # only be read on a platform with the same byte order and sizes
+    magic = name_to_bytes('elfesteem .debug_line 2 %s %s %d %d\n' % (
+        sys.byteorder, ADDR_TYPE,
+        array.array(ADDR_TYPE).itemsize, array.array('I').itemsize))
+    def save(self, f, key=data_empty):
+        """ Writes the tables in the file 'f' (path or file object);
+        'key' is a bytestring that identifies the ELF file """
+        if not hasattr(f, 'write'):
+            f = open(f, 'wb')
+            try:
+                return self.save(f, key)
+            finally:
+                f.close()
+        w = lambda fmt, *args: f.write(struct.pack('<'+fmt, *args))
+        f.write(self.magic)
+        w('I', len(key))
+        f.write(key)
+        w('I', len(self.units))
+        for unit in self.units:
+            names = name_to_bytes('\0'.join(unit.file_names))
+            w('QHII', unit.offset, unit.version, len(unit.file_names),
+              len(names))
+            f.write(names)
+            w('I', len(unit.sequences))
+            for (start, end), (first, stop) in zip(unit.sequences,
+                                                   unit.seq_rows):
+                w('QQII', start, end, first, stop)
+            w('I', len(unit))
+            for a in (unit.addresses, unit.files, unit.lines):
+                f.write(getattr(a, 'tobytes', getattr(a, 'tostring', None))())
+    def load(cls, f, key=None):
+        """ Reads the tables written by save(); None if 'key' is given
+        and is not the one of the file, or if the file was written on
+        another platform """
+        if not hasattr(f, 'read'):
+            f = open(f, 'rb')
+            try:
+                return cls.load(f, key)
+            finally:
+                f.close()
+        r = lambda fmt: struct.unpack('<'+fmt, f.read(struct.calcsize('<'+fmt)))
+        if f.read(len(cls.magic)) != cls.magic:
+            return None
+        length, = r('I')
+        stored = f.read(length)
+        if key is not None and stored != key:
+            return None
+        self = cls()
+        count, = r('I')
+        for _ in range(count):
+            unit = LineTable()
+            unit.offset, unit.version, nnames, length = r('QHII')
+            unit.file_names = bytes_to_name(f.read(length)).split('\0')
+            if nnames == 0:
+                unit.file_names = []
+            nseqs, = r('I')
+            seqs = [ r('QQII') for _ in range(nseqs) ]
+            unit.sequences = [ (start, end) for start, end, _, _ in seqs ]
+            unit.seq_rows = [ (first, stop) for _, _, first, stop in seqs ]
+            nrows, = r('I')
+            for a in (unit.addresses, unit.files, unit.lines):
+                data = f.read(nrows*a.itemsize)
+                getattr(a, 'frombytes', getattr(a, 'fromstring', None))(data)
+            unit._index()
+            self.units.append(unit)
+        self._index()
+        return self
+    load = classmethod(load)
+    def cached(cls, e, path):
+        """ Line number information of the ELF file 'e', read from the
+        cache file 'path' if it was written for this ELF file, else
+        decoded and written in this cache file. The ELF file is
+        identified by its build-id, or by the digest of .debug_line """
+        key = e.build_id()
+        if key is None:
+            import hashlib
+            sec = e.getsectionbyname('.debug_line')
+            data = data_empty
+            if sec is not None:
+                data = sec.content.pack()
+            key = name_to_bytes(hashlib.sha1(data).hexdigest())
+        try:
+            self = cls.load(path, key)
+        except (IOError, OSError, struct.error):
+            self = None
+        if self is None:
+            self = cls(e)
+            self.save(path, key)
+        return self
+    cached = classmethod(cached)
@@ -35,7 +35,15 @@ class Shdr(CStructWithStrTable):
         64: "  [%(idx)2d] %(name17)-17s %(type_txt)-15s  %(addr)016x  %(offset)08x\n       %(size)016x  %(entsize)016x %(flags_txt)3s      %(link)2d    %(info)2d    %(addralign)2d",
         }[_.wsize])
     name17 = property(lambda _: _.name[:17])
-    idx = property(lambda _: _.parent.parent.shlist.index(_.parent))
+    def idx(self):
+        # The section knows its index, unless the list was modified
+        # without SHList.append
+        shlist = self.parent.parent.shlist
+        idx = getattr(self.parent, '_idx', None)
+        if idx is None or idx >= len(shlist) or shlist[idx] is not self.parent:
+            idx = shlist.index(self.parent)
+        return idx
+    idx = property(idx)
     def flags_txt(self):
         ret = ""
         if self.flags & SHF_WRITE:            ret += "W"
@@ -94,6 +102,8 @@ class Phdr64(CStruct):
                 ("align","ptr") ]
 
 class Sym32(CStructWithStrTable):
+    _compact = True
+    __slots__ = ('_idx',) # Index in the symbol table
     _fields = [ ("name_idx","u32"),
                 ("value","u32"),
                 ("size","u32"),
@@ -101,7 +111,17 @@ class Sym32(CStructWithStrTable):
                 ("other","u08"),
                 ("shndx","u16") ]
     format = '%(idx)06d: %(value)08x %(size)4d %(type)-7s %(bind)-6s %(visibility)-7s  %(ndx)-3s %(name)s'
-    idx = property(lambda _: _.parent.symtab.index(_))
+    def idx(self):
+        # Set when the symbol is decoded or put in the symbol table;
+        # a symbol that was decoded while iterating is not in the table
+        symtab = self.parent.symtab
+        elts = getattr(symtab, '_elts', symtab)
+        idx = getattr(self, '_idx', None)
+        if idx is None or idx >= len(elts) or \
+                not (elts[idx] is self or elts[idx] is None):
+            idx = symtab.index(self)
+        return idx
+    idx = property(idx)
     strtab = property(lambda _: _.parent.linksection)
     type = property(lambda _: constants['STT'][_.info&0xf])
     bind = property(lambda _: constants['STB'][_.info>>4])
@@ -128,6 +148,7 @@ class Dym(CStruct):
                 ("val","u32") ]
 
 class RelBase(CStruct):
+    _compact = True
     def symbol(self):
         if not hasattr(self.parent.linksection, 'symtab'):
             # In some (invalid?) binaries, most sections are of
@@ -226,6 +247,30 @@ class Dyn64(Dyn32):
     _fields = [ ("type","u64"),
                 ("name_idx","u64") ]
 
+class Prstatus(CStruct):
+    # Content of a NT_PRSTATUS note of a Linux core file, struct
+    # elf_prstatus without pr_reg and pr_fpvalid, whose size depends
+    # on the architecture
+    _fields = [ ("signo","s32"),
+                ("code","s32"),
+                ("errno","s32"),
+                ("cursig","u16"),
+                ("pad","2s"),
+                ("sigpend","ptr"),
+                ("sighold","ptr"),
+                ("pid","s32"),
+                ("ppid","s32"),
+                ("pgrp","s32"),
+                ("sid","s32"),
+                ("utime_sec","ptr"),
+                ("utime_usec","ptr"),
+                ("stime_sec","ptr"),
+                ("stime_usec","ptr"),
+                ("cutime_sec","ptr"),
+                ("cutime_usec","ptr"),
+                ("cstime_sec","ptr"),
+                ("cstime_usec","ptr") ]
+
 
 no_show = {} # Values that will not appear in 'constants'
 
@@ -585,6 +630,7 @@ SHF_LINK_ORDER =       (1 << 7)   # Preserve order after combining
 SHF_OS_NONCONFORMING = (1 << 8)   # Non-standard OS specific handling required
 SHF_GROUP =            (1 << 9)   # Section is member of a group.
 SHF_TLS =             (1 << 10)   # Section hold thread-local data.
+SHF_COMPRESSED =      (1 << 11)   # Section with compressed data.
 SHF_MASKOS =          0x0ff00000  # OS-specific.
 SHF_MASKPROC =        0xf0000000  # Processor-specific
 SHF_ORDERED =         (1 << 30)   # Special ordering requirement (Solaris)
@@ -609,6 +655,12 @@ PT_LOOS =         0x60000000      # Start of OS-specific
 PT_GNU_EH_FRAME = 0x6474e550      # GCC .eh_frame_hdr segment
 PT_GNU_STACK =    0x6474e551      # Indicates stack executability
 PT_GNU_RELRO =    0x6474e552 
+PT_GNU_PROPERTY = 0x6474e553      # GNU property notes
+PT_GNU_SFRAME =   0x6474e554      # SFrame stack trace information
+PT_GNU_MBIND_LO = 0x6474e555      # Start of GNU mbind segments
+PT_GNU_MBIND_HI = 0x6474f554      # End of GNU mbind segments
+no_show['PT_GNU_MBIND_LO'] = True
+no_show['PT_GNU_MBIND_HI'] = True
 PT_LOSUNW =       0x6ffffffa 
 PT_SUNWBSS =      0x6ffffffa      # Sun Specific segment
 PT_SUNWSTACK =    0x6ffffffb      # Stack segment
@@ -649,11 +701,77 @@ NT_UTSNAME =      15              # Contains copy of utsname struct
 NT_LWPSTATUS =    16              # Contains copy of lwpstatus struct
 NT_LWPSINFO =     17              # Contains copy of lwpinfo struct
 NT_PRFPXREG =     20              # Contains copy of fprxregset struct
+NT_X86_XSTATE =   0x202           # x86 extended state using xsave
+NT_SIGINFO =      0x53494749      # Contains copy of siginfo_t
+NT_FILE =         0x46494c45      # Contains information about mapped files
+
+# Names of the registers in pr_reg of NT_PRSTATUS, for Linux
+
+prstatus_regs = {
+    EM_386: ('ebx', 'ecx', 'edx', 'esi', 'edi', 'ebp', 'eax',
+             'ds', 'es', 'fs', 'gs', 'orig_eax', 'eip', 'cs', 'eflags',
+             'esp', 'ss'),
+    EM_X86_64: ('r15', 'r14', 'r13', 'r12', 'rbp', 'rbx', 'r11', 'r10',
+                'r9', 'r8', 'rax', 'rcx', 'rdx', 'rsi', 'rdi', 'orig_rax',
+                'rip', 'cs', 'eflags', 'rsp', 'ss', 'fs_base', 'gs_base',
+                'ds', 'es', 'fs', 'gs'),
+    EM_ARM: tuple(['r%d' % _ for _ in range(13)]) +
+            ('sp', 'lr', 'pc', 'cpsr', 'orig_r0'),
+    EM_AARCH64: tuple(['x%d' % _ for _ in range(31)]) +
+                ('sp', 'pc', 'pstate'),
+    }
+
+# Legal values for a_type (entry type) of the auxiliary vector, NT_AUXV
+
+AT_NULL =         0               # End of vector
+AT_IGNORE =       1               # Entry should be ignored
+AT_EXECFD =       2               # File descriptor of program
+AT_PHDR =         3               # Program headers for program
+AT_PHENT =        4               # Size of program header entry
+AT_PHNUM =        5               # Number of program headers
+AT_PAGESZ =       6               # System page size
+AT_BASE =         7               # Base address of interpreter
+AT_FLAGS =        8               # Flags
+AT_ENTRY =        9               # Entry point of program
+AT_NOTELF =       10              # Program is not ELF
+AT_UID =          11              # Real uid
+AT_EUID =         12              # Effective uid
+AT_GID =          13              # Real gid
+AT_EGID =         14              # Effective gid
+AT_PLATFORM =     15              # String identifying platform
+AT_HWCAP =        16              # Machine-dependent processor capabilities
+AT_CLKTCK =       17              # Frequency of times()
+AT_FPUCW =        18              # Used FPU control word
+AT_DCACHEBSIZE =  19              # Data cache block size
+AT_ICACHEBSIZE =  20              # Instruction cache block size
+AT_UCACHEBSIZE =  21              # Unified cache block size
+AT_IGNOREPPC =    22              # Entry should be ignored
+AT_SECURE =       23              # Boolean, was exec setuid-like?
+AT_BASE_PLATFORM = 24             # String identifying real platforms
+AT_RANDOM =       25              # Address of 16 random bytes
+AT_HWCAP2 =       26              # More machine-dependent hints
+AT_EXECFN =       31              # Filename of executable
+AT_SYSINFO =      32              # Entry point of the vsyscall page
+AT_SYSINFO_EHDR = 33              # Address of the vDSO
+AT_MINSIGSTKSZ =  51              # Minimal stack size for signal delivery
 
 # Legal values for the note segment descriptor types for object files.
 
 NT_VERSION =      1               # Contains a version string.
 
+# Legal values for the types of the notes of name "GNU".
+
+NT_GNU_ABI_TAG =  1               # ABI information
+NT_GNU_HWCAP =    2               # Synthetic hwcap information
+NT_GNU_BUILD_ID = 3               # Unique build ID bitstring
+NT_GNU_GOLD_VERSION = 4           # Version of gold
+NT_GNU_PROPERTY_TYPE_0 = 5        # Program property
+
+# Legal values for ch_type (compression algorithm).
+
+ELFCOMPRESS_ZLIB =       1        # ZLIB/DEFLATE algorithm.
+ELFCOMPRESS_ZSTD =       2        # Zstandard algorithm.
+
 # Legal values for ST_BIND subfield of st_info (symbol binding).
 # bind = Sym.info >> 4
 # val = Sym.info 0xf
@@ -1988,6 +2106,7 @@ constants = {
   'ET'  : {}, # e_type
   'PT'  : {}, # p_type
   'DT'  : {}, # dynamic entry type
+  'AT'  : {}, # auxiliary vector entry type
   'R'   : {}, # special case, two levels of dictionary
   }
 enumerate_constants(constants, globals())
@@ -1,9 +1,12 @@
 #! /usr/bin/env python
 
 import struct
+import heapq
+from collections import deque
+from bisect import bisect_left, bisect_right
 
 from elfesteem import elf
-from elfesteem.strpatchwork import StrPatchwork
+from elfesteem.strpatchwork import StrPatchwork, ContentView, mmap_file, pack_parts
 import logging
 
 log = logging.getLogger("elfparse")
@@ -25,12 +28,36 @@ def inheritsexwsize(self, parent, kargs):
         elif parent != None:
             setattr(self, f, getattr(parent, f))
 
+class parsed(object):
+    """
+    Attribute of a section that is computed by parse_content, which is
+    called when one of these attributes is read for the first time.
+    If parse_content needs this attribute, e.g. because of a cycle in
+    the links between sections, ValueError is raised.
+    """
+    def __init__(self, name):
+        self.name = name
+    def __get__(self, obj, cls):
+        if obj is None:
+            return self
+        if obj.__dict__.get('_parsing', False):
+            raise ValueError("Section %r depends on itself" % obj.sh.name)
+        obj._parsing = True
+        try:
+            obj.parse_content()
+        finally:
+            obj._parsing = False
+        return obj.__dict__[self.name]
+
 class SectionMetaclass(type):
     sectypes = {}
     def __new__(cls, name, bases, dct):
         o = type.__new__(cls, name, bases, dct)
         if name != "SectionBase" and o.sht is not None:
             SectionMetaclass.sectypes[o.sht] = o
+        # Names of the parsed attributes
+        o._parsed = tuple(sorted(set([ k for c in o.__mro__ for k in c.__dict__
+                            if isinstance(getattr(o, k, None), parsed) ])))
         return o
 
 SectionBase = SectionMetaclass('SectionBase', (object,), {})
@@ -59,10 +86,31 @@ wsize = parent.wsize)
             self.phparent.resize(self, new-old)
     def parse_content(self):
         pass
+    def parse(self):
+        # Same as reading the parsed attributes: parse_content is called
+        # only if it was not called before
+        for name in self._parsed:
+            getattr(self, name)
+    def dependencies(self):
+        # Indexes of the sections that are needed to parse this one:
+        # sh.link, and sh.info if it is the index of a section
+        deps = set()
+        if self.sh.link:
+            deps.add(self.sh.link)
+        if self.sh.info and (self.sh.type in (elf.SHT_REL, elf.SHT_RELA)
+                             or self.sh.flags & elf.SHF_INFO_LINK):
+            deps.add(self.sh.info)
+        return deps
     def pack(self):
         data = self.content
         if type(data) != str: data = data.pack()
         return data
+    def pack_into(self, buf, off):
+        data = self.content
+        if type(data) != str: return data.pack_into(buf, off)
+        buf[off:off+len(data)] = data
+        return off+len(data)
+    bytelen = property(lambda _: len(_.content))
     def get_linksection(self):
         try:
             linksection = self.parent[self.sh.link]
@@ -76,8 +124,8 @@ wsize = parent.wsize)
             self.sh.link = val
     linksection = property(get_linksection, set_linksection)
     def get_infosection(self):
-        #XXX info may not be in sh list ?!?
-        if not self.sh.info in self.parent:
+        #XXX info may not be a section index
+        if not 0 <= self.sh.info < len(self.parent.shlist):
             return None
         return self.parent[self.sh.info]
     def set_infosection(self, val):
@@ -110,8 +158,113 @@ class NullSection(Section):
 class ProgBits(Section):
     sht = elf.SHT_PROGBITS
 
+def elf_hash(name):
+    # Hash function of the SHT_HASH sections, name is a bytestring
+    h = 0
+    for c in bytearray(name):
+        h = (h << 4) + c
+        g = h & 0xf0000000
+        if g: h ^= g >> 24
+        h &= ~g
+    return h
+
+def gnu_hash(name):
+    # Hash function of the SHT_GNU_HASH sections, name is a bytestring
+    h = 5381
+    for c in bytearray(name):
+        h = (h*33 + c) & 0xffffffff
+    return h
+
 class HashSection(Section):
     sht = elf.SHT_HASH
+    bucket = parsed('bucket')
+    chain = parsed('chain')
+    def parse_content(self):
+        self.bucket, self.chain = [], []
+        # Words are 32-bit, except for a few 64-bit architectures
+        fmt = {8: 'Q'}.get(self.sh.entsize, 'I')
+        sz = struct.calcsize(fmt)
+        c = self.content.pack()
+        if len(c) < 2*sz:
+            return
+        nbucket, nchain = struct.unpack(self.sex+fmt*2, c[:2*sz])
+        if (2+nbucket+nchain)*sz > len(c):
+            log.warn("Section %r is too small for the hash table", self.sh.name)
+            return
+        words = struct.unpack_from(self.sex+fmt*(nbucket+nchain), c, 2*sz)
+        self.bucket = list(words[:nbucket])
+        self.chain = list(words[nbucket:])
+    def lookup(self, name, symtab):
+        # Index in symtab of the symbol 'name' defined by this object,
+        # or None; undefined symbols are skipped, as ld.so does
+        if not self.bucket:
+            return None
+        idx = self.bucket[elf_hash(name_to_bytes(name)) % len(self.bucket)]
+        for _ in range(len(self.chain)):
+            if idx == 0 or idx >= len(self.chain):
+                break
+            sym = symtab[idx]
+            if sym is not None and sym.name == name \
+                    and sym.shndx != elf.SHN_UNDEF:
+                return idx
+            idx = self.chain[idx]
+        return None
+
+class GNUHashSection(Section):
+    sht = elf.SHT_GNU_HASH
+    symoffset = parsed('symoffset')
+    bloom_shift = parsed('bloom_shift')
+    bloom = parsed('bloom')
+    buckets = parsed('buckets')
+    chains = parsed('chains')
+    def parse_content(self):
+        self.symoffset, self.bloom_shift = 0, 0
+        self.bloom, self.buckets, self.chains = [], [], []
+        c = self.content.pack()
+        if len(c) < 16:
+            return
+        nbuckets, symoffset, bloom_size, bloom_shift = \
+            struct.unpack(self.sex+"IIII", c[:16])
+        # Bloom filter words have the size of the ELF class
+        bloom_fmt = {32: 'I', 64: 'Q'}[self.wsize]
+        off = 16 + bloom_size*self.wsize//8 + nbuckets*4
+        if off > len(c):
+            log.warn("Section %r is too small for the hash table", self.sh.name)
+            return
+        self.symoffset, self.bloom_shift = symoffset, bloom_shift
+        self.bloom = list(struct.unpack_from(
+            self.sex+bloom_fmt*bloom_size, c, 16))
+        self.buckets = list(struct.unpack_from(
+            self.sex+"I"*nbuckets, c, off-nbuckets*4))
+        self.chains = list(struct.unpack_from(
+            self.sex+"I"*((len(c)-off)//4), c, off))
+    def lookup(self, name, symtab):
+        # Index in symtab of the symbol 'name' defined by this object,
+        # or None; undefined symbols may be in the table, they are
+        # skipped, as ld.so does
+        h = gnu_hash(name_to_bytes(name))
+        if self.bloom:
+            C = self.wsize
+            word = self.bloom[(h // C) % len(self.bloom)]
+            mask = (1 << (h % C)) | (1 << ((h >> self.bloom_shift) % C))
+            if word & mask != mask:
+                return None
+        if not self.buckets:
+            return None
+        idx = self.buckets[h % len(self.buckets)]
+        if idx < self.symoffset:
+            return None
+        while idx - self.symoffset < len(self.chains):
+            h2 = self.chains[idx - self.symoffset]
+            if h|1 == h2|1:
+                sym = symtab[idx]
+                if sym is not None and sym.name == name \
+                        and sym.shndx != elf.SHN_UNDEF:
+                    return idx
+            if h2 & 1:
+                break
+            idx += 1
+        return None
 
 class NoBitsSection(Section):
     sht = elf.SHT_NOBITS
@@ -154,7 +307,7 @@ class GroupSection(Section):
         symbol = symbol[self.sh.info].name
         rep = [ "%s group section [%4d] `%s' [%s] contains %d sections:" % (
             flags,
-            self.parent.parent.sh.shlist.index(self),
+            self.sh.idx,
             self.sh.name,
             symbol,
             len(self.sections)) ]
@@ -186,23 +339,87 @@ class GNULibLIst(Section):
 class CheckSumSection(Section):
     sht = elf.SHT_CHECKSUM
 
+def iter_notes(content, start, stop, sex, align=4):
+    """
+    Generates (type, name, desc) for each note in content[start:stop],
+    as found in SHT_NOTE sections and PT_NOTE segments; only the header,
+    name and desc of each note are read from the content.
+    name and desc are padded to 8 bytes if 'align' (the alignment of the
+    section or segment) is 8, else to 4 bytes, as readelf does.
+    """
+    if align != 8:
+        align = 4
+    pad = lambda off: start + ((off - start + align - 1) & ~(align - 1))
+    pos = start
+    while pos + 12 <= stop:
+        namesz, descsz, type = struct.unpack(sex+"III", content[pos:pos+12])
+        name_start = pos + 12
+        desc_start = pad(name_start + namesz)
+        if desc_start + descsz > stop:
+            log.warn("Truncated note at offset %#x", pos)
+            return
+        yield (type,
+               content[name_start:name_start+namesz],
+               content[desc_start:desc_start+descsz])
+        pos = pad(desc_start + descsz)
+
+def find_build_id(notes):
+    # Content of the first GNU build-id note, or None
+    for type, name, desc in notes:
+        if type == elf.NT_GNU_BUILD_ID and name == struct.pack("4s", "GNU".encode('latin1')):
+            return desc
+    return None
+
+def build_id(data):
+    """
+    Content of the GNU build-id note of the ELF file 'data' (bytes or
+    mmap), or None. Only the ELF header, the program headers (or the
+    section headers if there is no PT_NOTE) and the notes are read.
+    """
+    if data[:4] != struct.pack("4B", 0x7f,0x45,0x4c,0x46):
+        raise ValueError("Not an ELF")
+    wsize, sex = struct.unpack("BB", data[4:6])
+    sex = {1:'<', 2:'>'}[sex]
+    if wsize == 1:
+        phoff, shoff = struct.unpack(sex+"II", data[28:36])
+        phentsize, phnum, shentsize, shnum = struct.unpack(sex+"HHHH", data[42:50])
+        # type, offset, filesz/size, align/addralign
+        phdr, shdr = sex+"II8xI8xI", sex+"4xI8xII8xI"
+    else:
+        phoff, shoff = struct.unpack(sex+"QQ", data[32:48])
+        phentsize, phnum, shentsize, shnum = struct.unpack(sex+"HHHH", data[54:62])
+        phdr, shdr = sex+"I4xQ16xQ8xQ", sex+"4xI16xQQ8xQ"
+    for off, num, entsize, fmt, note_type in (
+            (phoff, phnum, phentsize, phdr, elf.PT_NOTE),
+            (shoff, shnum, shentsize, shdr, elf.SHT_NOTE)):
+        size = struct.calcsize(fmt)
+        if off == 0 or entsize < size:
+            continue
+        for i in range(num):
+            pos = off + i*entsize
+            type, start, length, align = struct.unpack(fmt, data[pos:pos+size])
+            if type != note_type:
+                continue
+            res = find_build_id(iter_notes(data, start, start+length, sex, align))
+            if res is not None:
+                return res
+    return None
+
 class NoteSection(Section):
     sht = elf.SHT_NOTE
+    notes = parsed('notes')
+    def iter_notes(self):
+        return iter_notes(self.content, 0, len(self.content), self.sex,
+                          self.sh.addralign)
     def parse_content(self):
-        c = self.content
-        self.notes = []
-        # XXX: c may not be aligned?
-        while len(c)> 12:
-            namesz,descsz,typ = struct.unpack("III",c[:12])
-            name = c[12:12+namesz]
-            desc = c[12+namesz:12+namesz+descsz]
-            c = c[12+namesz+descsz:]
-            self.notes.append((typ,name,desc))
+        self.notes = list(self.iter_notes())
 
 
 
 class Dynamic(Section):
     sht = elf.SHT_DYNAMIC
+    dyntab = parsed('dyntab')
+    dynamic = parsed('dynamic')
     def parse_content(self):
         Dyn = { 32: elf.Dyn32, 64: elf.Dyn64 }[self.wsize]
         c = self.content
@@ -224,26 +441,117 @@ class Dynamic(Section):
             return self.dynamic[item]
         return self.dyntab[item]
 
-from elfesteem.cstruct import data_null, bytes_to_name, name_to_bytes
+from elfesteem.cstruct import data_null, data_empty, bytes_to_name, name_to_bytes
 
 class StrTable(Section):
     sht = elf.SHT_STRTAB
+    # Names are cached by offset, and offsets by name; the caches are
+    # emptied when the content is replaced or modified (StrPatchwork
+    # has a version number). Names are read in the content, which is
+    # not copied, e.g. it may be a view of the file.
+    _cached = None
+    _version = None
+
+    def _cache(self):
+        c = self.content
+        version = getattr(c, 'version', None)
+        if self._cached is not c or self._version != version:
+            self._cached, self._version = c, version
+            self._by_offset = {}
+            self._by_name = None
+        return self._by_offset
 
     def get_name(self, idx):
-        n = self.content[idx:self.content.find(data_null, idx)]
-        return bytes_to_name(n)
+        by_offset = self._cache()
+        try:
+            return by_offset[idx]
+        except KeyError:
+            pass
+        c = self.content
+        name = bytes_to_name(c[idx:c.find(data_null, idx)])
+        by_offset[idx] = name
+        return name
+
+    def _name_reader(self):
+        # Same as get_name, to read many names, e.g. of all the symbols;
+        # the content is copied once, instead of being read for each name
+        by_offset = self._cache()
+        data = self.content
+        if hasattr(data, 'pack'): data = data.pack()
+        def get_name(idx):
+            try:
+                return by_offset[idx]
+            except KeyError:
+                pass
+            name = bytes_to_name(data[idx:data.find(data_null, idx)])
+            by_offset[idx] = name
+            return name
+        return get_name
+
+    def _name_offsets(self):
+        # Offset of each string of the table, by name; built with one
+        # pass over the content
+        self._cache()
+        if self._by_name is None:
+            self._by_name = {}
+            pos = 0
+            data = self.content
+            if hasattr(data, 'pack'): data = data.pack()
+            for name in data.split(data_null)[:-1]:
+                if not name in self._by_name:
+                    self._by_name[name] = pos
+                pos += len(name)+1
+        return self._by_name
+
+    def _shift_sections(self, dif):
+        # Sections after this one in the file are moved
+        for sh in self.parent.shlist:
+            if sh.sh.offset > self.sh.offset:
+                sh.sh.offset += dif
 
     def add_name(self, name):
         name = name_to_bytes(name)
-        if data_null+name+data_null in self.content:
-            return self.content.find(name)
+        by_name = self._name_offsets()
+        if name in by_name:
+            return by_name[name]
         idx = len(self.content)
         self.content[idx] = name+data_null
-        for sh in self.parent.shlist:
-            if sh.sh.offset > self.sh.offset:
-                sh.sh.offset += len(name)+1
+        # The caches are updated instead of being emptied
+        self._version = self.content.version
+        by_name[name] = idx
+        self._shift_sections(len(name)+1)
         return idx
 
+    def build(self, names):
+        """
+        Replaces the content with a table of all the names, where a name
+        that is the end of another one is not repeated (tail merging, as
+        done by ld); returns a dictionary of the offset of each name.
+        Sorted by their reversed bytes, names come after the names they
+        end, therefore the table is built in one pass after sorting.
+        """
+        names = list(names)
+        offsets = { data_empty: 0 }
+        data = [ data_null ]
+        pos, prev = 1, None
+        order = set([name_to_bytes(_) for _ in names])
+        order.discard(data_empty)
+        for name in sorted(order, key=lambda _: _[::-1], reverse=True):
+            if prev is not None and prev.endswith(name):
+                offsets[name] = offsets[prev] + len(prev) - len(name)
+                continue
+            offsets[name] = pos
+            data.append(name+data_null)
+            pos += len(name)+1
+            prev = name
+        dif = pos - len(self.content)
+        self.content = StrPatchwork(data_empty.join(data))
+        self._cache()
+        self._by_name = offsets
+        if dif:
+            self._shift_sections(dif)
+        return dict([ (_, offsets[name_to_bytes(_)]) for _ in names ])
+
     def mod_name(self, idx, name):
         name = name_to_bytes(name)
         n = self.content[idx:self.content.find(data_null, idx)]
@@ -259,26 +567,200 @@ class StrTable(Section):
                     sh.sh.offset += dif
         return idx
 
+def entries_as_array(section, cls, entsize=None):
+    # NumPy structured array with the fields of 'cls', decoded from the
+    # content of the section; numpy is only needed if this is called
+    import numpy
+    layout = cls._get_layout(section.sex, section.wsize)
+    if not entsize:
+        entsize = section.sh.entsize or layout.size
+    if entsize < layout.size:
+        raise ValueError("Section %r has entries of size %d, smaller than %s"
+                         % (section.sh.name, entsize, cls.__name__))
+    data = section.content.pack()
+    dtype = numpy.dtype(layout.numpy_dtype(entsize))
+    return numpy.frombuffer(data, dtype=dtype, count=len(data)//entsize)
+
+def table_field(data, sex, layout, fname, entsize, count, start=0):
+    # Values of one field of a table of 'count' entries of 'entsize'
+    # bytes, at offset 'start' of 'data'; the table is decoded by blocks
+    # of entries, and only the values of this field are kept. Entries
+    # are padded when decoded.
+    offset, st = layout.fields[fname]
+    if offset + st.size > entsize:
+        # The field is after the end of the entry
+        end = start + max(0, count-1)*entsize + layout.size
+        data = data[start:end]
+        data += data_null * (end - start - len(data))
+        return [ st.unpack_from(data, idx*entsize+offset)[0]
+                 for idx in range(count) ]
+    fmt = "%dx%s%dx" % (offset, layout.format[fname],
+                        entsize - offset - st.size)
+    block = 1024
+    full = struct.Struct(sex + fmt*min(block, count))
+    values = []
+    for pos in range(0, count, block):
+        n = min(block, count-pos)
+        if n*entsize == full.size: blk = full
+        else:                      blk = struct.Struct(sex + fmt*n)
+        s = data[start+pos*entsize:start+(pos+n)*entsize]
+        s += data_null * (n*entsize - len(s))
+        values.extend(blk.unpack(s))
+    return values
+
+def entries_field(section, cls, fname, entsize=None):
+    # Values of one field of all entries of the section, decoded in
+    # bulk instead of one object per entry
+    layout = cls._get_layout(section.sex, section.wsize)
+    if not entsize:
+        entsize = section.sh.entsize or layout.size
+    n = (len(section.content) + entsize - 1) // entsize
+    return table_field(section.content, section.sex, layout, fname,
+                       entsize, n)
+
+class EntryList(object):
+    """
+    The entries of a section made of fixed-size structures, e.g. the
+    symbols of a symbol table. It behaves as a list, but each entry is
+    only decoded when it is accessed for the first time, then it is
+    kept; iterating over the list decodes the entries by blocks, and
+    iter_entries(keep=False) does not keep them, e.g. to display them.
+    """
+    def __init__(self, section, cls):
+        self.section = section
+        self.cls = cls
+        self.entsize = section.sh.entsize
+        if self.entsize == 0:
+            self.entsize = cls._get_layout(section.sex, section.wsize).size
+        n = (len(section.content) + self.entsize - 1) // self.entsize
+        self._elts = [None] * n
+    def _decode(self, idx):
+        sz = self.entsize
+        c = self.section.content
+        if idx*sz >= len(c):
+            return None
+        elt = self.cls(parent=self.section, content=c[sz*idx:sz*(idx+1)])
+        self._set_index(elt, idx)
+        return elt
+    def _set_index(self, elt, idx):
+        # Entries that have an attribute _idx know their index
+        try:
+            elt._idx = idx
+        except AttributeError:
+            pass
+    def __len__(self):
+        return len(self._elts)
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [ self[idx] for idx in range(*item.indices(len(self))) ]
+        elt = self._elts[item]
+        if elt is None:
+            if item < 0: item += len(self._elts)
+            elt = self._decode(item)
+            self._elts[item] = elt
+        return elt
+    def __setitem__(self, item, val):
+        self._elts[item] = val
+        if val is not None:
+            if item < 0: item += len(self._elts)
+            self._set_index(val, item)
+    def __iter__(self):
+        return self.iter_entries()
+    def iter_entries(self, keep=True):
+        sz = self.entsize
+        c = self.section.content
+        if sz < self.cls._get_layout(self.section.sex, self.section.wsize).size:
+            # Each entry is padded when decoded
+            for idx, elt in enumerate(self._elts):
+                if elt is None:
+                    elt = self._decode(idx)
+                    if keep: self._elts[idx] = elt
+                yield elt
+            return
+        # The content is read by blocks of entries
+        block = 1024
+        for start in range(0, len(self._elts), block):
+            data = c[start*sz:(start+block)*sz]
+            for idx in range(start, min(start+block, len(self._elts))):
+                elt = self._elts[idx]
+                if elt is None and (idx-start)*sz < len(data):
+                    elt = self.cls(parent=self.section, content=data,
+                                   start=(idx-start)*sz)
+                    self._set_index(elt, idx)
+                    if keep: self._elts[idx] = elt
+                yield elt
+    def append(self, val):
+        self._elts.append(val)
+        if val is not None:
+            self._set_index(val, len(self._elts)-1)
+    def extend(self, val):
+        for elt in val:
+            self.append(elt)
+    def index(self, val):
+        for idx, elt in enumerate(self._elts):
+            if elt is val:
+                return idx
+        raise ValueError("%r is not in list" % val)
+    def as_array(self):
+        return entries_as_array(self.section, self.cls, self.entsize)
+
 class SymTable(Section):
     sht = elf.SHT_SYMTAB
-    def __init__(self, *args, **kargs):
-        Section.__init__(self, *args, **kargs)
-        self.symtab=[]
-        self.symbols={}
+    symtab = parsed('symtab')
+    _symbols = None
+    _names = None
     def parse_content(self):
         Sym = { 32: elf.Sym32, 64: elf.Sym64 }[self.wsize]
-        c = self.content
-        sz = self.sh.entsize
-        idx = 0
-        while len(c) > sz*idx:
-            s = c[sz*idx:sz*(idx+1)]
-            idx += 1
-            sym = Sym(parent=self, content=s)
-            self.symtab.append(sym)
-            self.symbols[sym.name] = sym
+        self.symtab = EntryList(self, Sym)
+        self._symbols = None
+        self._names = None
+    def get_symbols(self):
+        # Dictionary of all symbols, by name; all symbols are decoded
+        symtab = self.symtab
+        if self._symbols is None:
+            self._symbols = {}
+            for idx in range(len(symtab)):
+                sym = symtab[idx]
+                if sym is not None:
+                    self._symbols[sym.name] = sym
+        return self._symbols
+    symbols = property(get_symbols)
+    def as_array(self):
+        """
+        Symbols as a read-only NumPy structured array, one column per
+        field of Sym32/Sym64 (name_idx, value, size, info, other, shndx);
+        e.g. global functions larger than 4 KiB are
+          a[(a['info'] == (elf.STB_GLOBAL<<4)|elf.STT_FUNC) & (a['size'] > 4096)]
+        The array is decoded from the section content, therefore symbols
+        modified in place without SymTable.__setitem__ are not seen.
+        """
+        return self.symtab.as_array()
+    def _name_index(self):
+        # Index of the last symbol having a given name; only name_idx
+        # is read for symbols that are not yet decoded
+        symtab = self.symtab
+        if self._names is None:
+            offset, st = symtab.cls._get_layout(self.sex, self.wsize).fields['name_idx']
+            c = self.content.pack()
+            get_name = self.linksection.get_name
+            if isinstance(self.linksection, StrTable):
+                get_name = self.linksection._name_reader()
+            self._names = {}
+            for idx, sym in enumerate(symtab._elts):
+                if sym is not None:
+                    self._names[sym.name] = idx
+                elif idx*symtab.entsize+offset+st.size <= len(c):
+                    name_idx, = st.unpack_from(c, idx*symtab.entsize+offset)
+                    self._names[get_name(name_idx)] = idx
+                elif symtab[idx] is not None:
+                    # Truncated last entry
+                    self._names[symtab[idx].name] = idx
+        return self._names
     def __getitem__(self,item):
         if type(item) is str:
-            return self.symbols[item]
+            if self._symbols is not None:
+                return self._symbols[item]
+            return self.symtab[self._name_index()[item]]
         return self.symtab[item]
     def __setitem__(self,item,val):
         if not isinstance(val, elf.Sym32):
@@ -286,60 +768,147 @@ class SymTable(Section):
         if item >= len(self.symtab):
             self.symtab.extend([None for i in range(item+1-len(self.symtab))])
         self.symtab[item] = val
-        self.symbols[val.name] = val
+        if self._symbols is not None:
+            self._symbols[val.name] = val
+        if self._names is not None:
+            self._names[val.name] = item
         self.content[item*self.sh.entsize] = val.pack()
         if val.info>>4 == elf.STB_LOCAL and item >= self.sh.info:
             # One greater than the symbol table index of the last local symbol
             self.sh.info = item+1
-    def readelf_display(self):
-        rep = [ "Symbol table '%s' contains %d entries:"
-                % (self.sh.name, len(self.symtab)) ]
+    def readelf_lines(self):
+        # Generates the lines of readelf_display, the symbols are decoded
+        # one at a time and are not kept in the symbol table
+        yield "Symbol table '%s' contains %d entries:" % (
+              self.sh.name, len(self.symtab))
         if self.wsize == 32:
-            rep.append("   Num:    Value  Size Type    Bind   Vis      Ndx Name")
+            yield "   Num:    Value  Size Type    Bind   Vis      Ndx Name"
         elif self.wsize == 64:
-            rep.append("   Num:    Value          Size Type    Bind   Vis      Ndx Name")
-        rep.extend([ _.readelf_display() for _ in self.symtab ])
-        return "\n".join(rep)
+            yield "   Num:    Value          Size Type    Bind   Vis      Ndx Name"
+        for sym in self.symtab.iter_entries(keep=False):
+            yield sym.readelf_display()
+    def readelf_display(self):
+        return "\n".join(self.readelf_lines())
 
 
 class DynSymTable(SymTable):
     sht = elf.SHT_DYNSYM
+    _hash = None
+    def parse_content(self):
+        SymTable.parse_content(self)
+        self._hash = None
+    def _hash_section(self):
+        # The hash table of this symbol table, or None; it is found by
+        # the first lookup, and forgotten with the index of the names
+        self.symtab
+        if self._hash is None:
+            hash = None
+            for s in self.parent.shlist:
+                if isinstance(s, (GNUHashSection, HashSection)) \
+                        and s.linksection is self:
+                    if hash is None or isinstance(s, GNUHashSection):
+                        hash = s
+            # One-element tuple, None is a valid result
+            self._hash = (hash,)
+        return self._hash[0]
+    def lookup(self, name):
+        """
+        Symbol defined by this object with a given name, or None; the
+        undefined symbols (imports) are never returned. The hash table
+        of this symbol table is used if there is one (.gnu.hash has
+        priority over .hash), then only the symbols in the hash table
+        are found.
+        """
+        hash = self._hash_section()
+        if hash is None:
+            idx = self._name_index().get(name)
+            if idx is not None and self.symtab[idx].shndx == elf.SHN_UNDEF:
+                # The last symbol with this name is an import, another
+                # one may be defined
+                idx = None
+                for i in range(len(self.symtab)):
+                    sym = self.symtab[i]
+                    if sym is not None and sym.name == name \
+                            and sym.shndx != elf.SHN_UNDEF:
+                        idx = i
+        else:
+            idx = hash.lookup(name, self.symtab)
+        if idx is None:
+            return None
+        return self.symtab[idx]
 
 
 class RelTable(Section):
     sht = elf.SHT_REL
-    def parse_content(self):
-        if self.__class__.sht == elf.SHT_REL:
-            Rel = { 32: elf.Rel32,  64: elf.Rel64 }[self.wsize]
-        elif self.__class__.sht == elf.SHT_RELA:
-            Rel = { 32: elf.Rela32, 64: elf.Rela64 }[self.wsize]
+    reltab = parsed('reltab')
+    _rel = None
+    _offsets = None
+    def entry_class(self):
         if self.parent.parent.Ehdr.machine == elf.EM_MIPS and self.wsize == 64:
-            Rel = elf.Rel64MIPS
-        c = self.content
-        self.reltab=[]
-        self.rel = {}
-        sz = self.sh.entsize
-        idx = 0
-        while len(c) > sz*idx:
-            s = c[sz*idx:sz*(idx+1)]
-            idx += 1
-            rel = Rel(parent=self, content=s)
-            self.reltab.append(rel)
-            self.rel[rel.sym] = rel
-    def readelf_display(self):
-        ret = "Relocation section %r at offset 0x%x contains %d entries:" % (
+            return elf.Rel64MIPS
+        if self.__class__.sht == elf.SHT_RELA:
+            return { 32: elf.Rela32, 64: elf.Rela64 }[self.wsize]
+        return { 32: elf.Rel32,  64: elf.Rel64 }[self.wsize]
+    entry_class = property(entry_class)
+    def parse_content(self):
+        self.reltab = EntryList(self, self.entry_class)
+        self._rel = None
+        self._offsets = None
+        self.parent.parent._reloc_index = None
+    def get_rel(self):
+        # Dictionary of relocations, by symbol name; only the last
+        # relocation of each symbol is kept; all relocations are decoded
+        reltab = self.reltab
+        if self._rel is None:
+            self._rel = {}
+            for rel in reltab[:]:
+                self._rel[rel.sym] = rel
+        return self._rel
+    rel = property(get_rel)
+    def offset_index(self):
+        """ (offsets, indexes): the offsets of the relocations, sorted,
+        and the index in reltab of each of these relocations.
+        The offsets are decoded from the section content in bulk, when
+        this index is needed for the first time """
+        reltab = self.reltab
+        if self._offsets is None:
+            offsets = entries_field(self, reltab.cls, 'offset', reltab.entsize)
+            order = sorted(range(len(offsets)), key=offsets.__getitem__)
+            self._offsets = ([offsets[_] for _ in order], order)
+        return self._offsets
+    def getrelocsbyoffset(self, start, stop=None):
+        """ Relocations at offset 'start', or with an offset in
+        [start:stop], sorted by offset; found by dichotomy, only the
+        relocations that are found are decoded """
+        offsets, order = self.offset_index()
+        if stop is None:
+            stop = start + 1
+        i = bisect_left(offsets, start)
+        j = bisect_left(offsets, stop, i)
+        return [ self.reltab[_] for _ in order[i:j] ]
+    def as_array(self):
+        """
+        Relocations as a read-only NumPy structured array, with the fields
+        of the Rel class (offset, info and addend for RELA); the symbol
+        index and the type are in 'info', e.g. a['info'] >> 32 for 64-bit
+        """
+        return entries_as_array(self, self.entry_class)
+    def readelf_lines(self):
+        yield "Relocation section %r at offset 0x%x contains %d entries:" % (
             self.sh.name,
             self.sh.offset,
             len(self.reltab))
         if self.wsize == 32:
-            ret += "\n Offset     Info    Type            Sym.Value  Sym. Name"
+            ret = " Offset     Info    Type            Sym.Value  Sym. Name"
         elif self.wsize == 64:
-            ret += "\n  Offset          Info           Type           Sym. Value    Sym. Name"
+            ret = "  Offset          Info           Type           Sym. Value    Sym. Name"
         if self.sht == elf.SHT_RELA:
             ret += " + Addend"
-        for r in self.reltab:
-            ret += "\n" + r.readelf_display()
-        return ret
+        yield ret
+        for r in self.reltab.iter_entries(keep=False):
+            yield r.readelf_display()
+    def readelf_display(self):
+        return "\n".join(self.readelf_lines())
 
 class RelATable(RelTable):
     sht = elf.SHT_RELA
@@ -369,24 +938,53 @@ class SHList(object):
                     return "<no-name>"
             self._shstrtab = NoStrTab()
 
+        # The content of a section is a view of the file, which is only
+        # copied when it is modified; sections are parsed only when
+        # their parsed attributes (e.g. symtab) are read
         for s in self.shlist:
-            if not isinstance(s, NoBitsSection):
-                s.content = StrPatchwork(parent[s.sh.offset: s.sh.offset+s.sh.size])
-        # Follow dependencies when initializing sections
-        zero = self.shlist[0]
-        todo = self.shlist[1:]
-        done = []
-        while todo:
-            s = todo.pop(0)
-            if ( (s.linksection in done + [zero, None])
-                 and  (s.infosection in  [zero, None] or s.infosection in done)):
-                done.append(s)
-                s.parse_content()
+            if isinstance(s, NoBitsSection):
+                continue
+            start, stop = s.sh.offset, s.sh.offset+s.sh.size
+            if stop <= len(parent.content):
+                s.content = StrPatchwork(ContentView(parent.content, start, stop))
             else:
-                todo.append(s)
-        for s in self.shlist:
+                # Truncated file, the missing part is padded
+                s.content = StrPatchwork(parent[start:stop])
+        for idx, s in enumerate(self.shlist):
+            s._idx = idx
             self.do_add_section(s)
 
+    def parse_all(self):
+        """
+        Parses all sections, each one after the sections it depends on,
+        in one topological pass over their links. The sections that are
+        in a dependency cycle (or depend on one) are reported, parsed in
+        their order in the list and returned; there are none in a valid
+        ELF file.
+        """
+        n = len(self.shlist)
+        users = [ [] for _ in range(n) ]
+        count = [ 0 ] * n
+        for idx, s in enumerate(self.shlist):
+            for dep in s.dependencies():
+                if 0 < dep < n:
+                    users[dep].append(idx)
+                    count[idx] += 1
+        todo = deque([ idx for idx in range(n) if count[idx] == 0 ])
+        while todo:
+            idx = todo.popleft()
+            self.shlist[idx].parse()
+            for user in users[idx]:
+                count[user] -= 1
+                if count[user] == 0:
+                    todo.append(user)
+        cycle = [ self.shlist[idx] for idx in range(n) if count[idx] > 0 ]
+        if cycle:
+            log.error("Dependency cycle between sections %s",
+                      ", ".join([repr(s.sh.name) for s in cycle]))
+        for s in cycle:
+            s.parse()
+        return cycle
     def do_add_section(self, section):
         n = section.sh.name
         if n.startswith("."):
@@ -395,7 +993,10 @@ class SHList(object):
         setattr(self, n, section) #xxx
     def append(self, item):
         self.do_add_section(item)
+        item._idx = len(self.shlist)
         self.shlist.append(item)
+        self.parent._vad_index = None
+        self.parent._reloc_index = None
     def __getitem__(self, item):
         return self.shlist[item]
     def __repr__(self):
@@ -403,23 +1004,27 @@ class SHList(object):
         for i,s in enumerate(self.shlist):
             rep.append("%2i %r %s" % (i, s, s.__class__.__name__))
         return "\n".join(rep)
-    def readelf_display(self):
-        rep = [ "There are %d section headers, starting at offset %#x:"
-                % (len(self.shlist), self.parent.Ehdr.shoff),
-                "",
-                "Section Headers:" ]
+    def readelf_lines(self):
+        yield "There are %d section headers, starting at offset %#x:" % (
+              len(self.shlist), self.parent.Ehdr.shoff)
+        yield ""
+        yield "Section Headers:"
         if self.wsize == 32:
-            rep.append( "  [Nr] Name              Type            Addr     Off    Size   ES Flg Lk Inf Al" )
+            yield "  [Nr] Name              Type            Addr     Off    Size   ES Flg Lk Inf Al"
         elif self.wsize == 64:
-            rep.extend(["  [Nr] Name              Type             Address           Offset","       Size              EntSize          Flags  Link  Info  Align"])
-        rep.extend([ _.sh.readelf_display() for _ in self ])
-        rep.extend([ # Footer
+            yield "  [Nr] Name              Type             Address           Offset"
+            yield "       Size              EntSize          Flags  Link  Info  Align"
+        for s in self:
+            yield s.sh.readelf_display()
+        for line in [ # Footer
 "Key to Flags:",
 "  W (write), A (alloc), X (execute), M (merge), S (strings)",
 "  I (info), L (link order), G (group), T (TLS), E (exclude), x (unknown)",
 "  O (extra OS processing required) o (OS specific), p (processor specific)",
-            ])
-        return "\n".join(rep)
+            ]:
+            yield line
+    def readelf_display(self):
+        return "\n".join(self.readelf_lines())
     def __str__(self):
         raise AttributeError("Use pack() instead of str()")
     def pack(self):
@@ -427,7 +1032,13 @@ class SHList(object):
         for s in self.shlist:
             c += s.sh.pack()
         return c
+    def pack_into(self, buf, off):
+        for s in self.shlist:
+            off = s.sh.pack_into(buf, off)
+        return off
+    bytelen = property(lambda _: sum([s.sh.bytelen for s in _.shlist]))
     def resize(self, sec, diff):
+        self.parent._vad_index = None
         for s in self.shlist:
             if s.sh.offset > sec.sh.offset:
                 s.sh.offset += diff
@@ -444,40 +1055,20 @@ class ProgramHeader(object):
         self.parent = parent
         inheritsexwsize(self, parent, kargs)
         self.ph = PHtype(parent=self, content=phstr)
+        # Computed by PHList.map_sections
         self.shlist = [] # based on readelf's "Section to Segment mapping"
         self.shlist_partial = [] # These are other sections of interest
-        ph_file_end = self.ph.offset+self.ph.filesz
-        ph_mem_end  = self.ph.vaddr+self.ph.memsz
-        for s in self.parent.parent.sh:
-            if isinstance(s, NullSection):
-                continue
-            if self.ph.type != elf.PT_TLS and (
-               (s.sh.flags & elf.SHF_TLS) and s.sh.type == elf.SHT_NOBITS):
-                # .tbss is special.  It doesn't contribute memory space
-                # to normal segments.
-                continue
-            if s.sh.flags & elf.SHF_ALLOC:
-                if   (self.ph.vaddr <= s.sh.addr) and \
-                     (s.sh.addr+s.sh.size <= ph_mem_end):
-                    s.phparent = self
-                    self.shlist.append(s)
-            else:
-                if   (self.ph.offset <= s.sh.offset) and \
-                     (s.sh.offset+s.sh.size <= ph_file_end):
-                    s.phparent = self
-                    self.shlist.append(s)
-            if s in self.shlist:
-                continue
-            if   self.ph.offset <= s.sh.offset           < ph_file_end:
-                # Section start in Segment
-                self.shlist_partial.append(s)
-            elif self.ph.offset < s.sh.offset+s.sh.size <= ph_file_end:
-                # Section end in Segment
-                self.shlist_partial.append(s)
     def resize(self, sec, diff):
         self.ph.filesz += diff
         self.ph.memsz += diff
         self.parent.resize(sec, diff)
+    def iter_notes(self):
+        # Notes of a PT_NOTE segment, read in the file content
+        if self.ph.type != elf.PT_NOTE:
+            return iter(())
+        return iter_notes(self.parent.parent.content,
+                          self.ph.offset, self.ph.offset+self.ph.filesz,
+                          self.sex, self.ph.align)
     # get_rvaitem needs addr and size (same names as in the Shdr class)
     # Note that we should always have memsz >= filesz unless memsz == 0
     # Note that paddr is irrelevant for most OS
@@ -488,6 +1079,61 @@ class ProgramHeader(object):
         return self.ph.vaddr
     addr = property(get_addr)
 
+def section_in_segment(sh, ph):
+    # Same test as readelf's "Section to Segment mapping", which is
+    # ELF_SECTION_IN_SEGMENT_STRICT of binutils, for a Shdr and a Phdr
+    tls = sh.flags & elf.SHF_TLS
+    if tls and not ph.type in (elf.PT_TLS, elf.PT_GNU_RELRO, elf.PT_LOAD):
+        return False
+    if not tls and ph.type in (elf.PT_TLS, elf.PT_PHDR):
+        return False
+    alloc = sh.flags & elf.SHF_ALLOC
+    if not alloc and (ph.type in (elf.PT_LOAD, elf.PT_DYNAMIC,
+            elf.PT_GNU_EH_FRAME, elf.PT_GNU_STACK, elf.PT_GNU_RELRO,
+            elf.PT_GNU_SFRAME)
+            or elf.PT_GNU_MBIND_LO <= ph.type <= elf.PT_GNU_MBIND_HI):
+        return False
+    size = sh.size
+    if tls and sh.type == elf.SHT_NOBITS and ph.type != elf.PT_TLS:
+        size = 0
+    if sh.type != elf.SHT_NOBITS:
+        if sh.offset < ph.offset or sh.offset - ph.offset + size > ph.filesz:
+            return False
+        if ph.filesz and sh.offset - ph.offset >= ph.filesz:
+            return False
+    if alloc:
+        if sh.addr < ph.vaddr or sh.addr - ph.vaddr + size > ph.memsz:
+            return False
+        if ph.memsz and sh.addr - ph.vaddr >= ph.memsz:
+            return False
+    # No empty section at the start or the end of PT_DYNAMIC or PT_NOTE
+    if ph.type in (elf.PT_DYNAMIC, elf.PT_NOTE) and sh.size == 0 \
+            and ph.memsz != 0:
+        if sh.type != elf.SHT_NOBITS and not \
+                (ph.offset < sh.offset < ph.offset + ph.filesz):
+            return False
+        if alloc and not (ph.vaddr < sh.addr < ph.vaddr + ph.memsz):
+            return False
+    return True
+
+def intervals_containing(intervals, points):
+    # For each point, the indexes of the intervals [start, end] that
+    # contain it, sorted; one sweep over the sorted bounds and points
+    events = []
+    for idx, (start, end) in enumerate(intervals):
+        events.append((start, 0, idx))
+        events.append((end, 2, idx))
+    for idx, point in enumerate(points):
+        events.append((point, 1, idx))
+    events.sort()
+    active = set()
+    res = [None] * len(points)
+    for _, kind, idx in events:
+        if   kind == 0: active.add(idx)
+        elif kind == 2: active.discard(idx)
+        else:           res[idx] = sorted(active)
+    return res
+
 class PHList(object):
     def __init__(self, parent, **kargs):
         self.parent = parent
@@ -502,6 +1148,54 @@ class PHList(object):
                 { 32: elf.Phdr32, 64: elf.Phdr64 }[self.wsize],
                 phstr))
             of1 = of2
+        self.map_sections()
+
+    def map_sections(self):
+        """
+        Computes, for each segment, the list of its sections (shlist) and
+        of the other sections that start or end in its file content
+        (shlist_partial), and the segment of each section (phparent).
+        Instead of testing each section with each segment, the segments
+        that may contain a section are found by a sweep over the sorted
+        bounds, then tested as readelf does.
+        """
+        phs = [ p.ph for p in self.phlist ]
+        sections = [ s for s in self.parent.sh
+                     if not isinstance(s, NullSection) ]
+        for p in self.phlist:
+            p.shlist, p.shlist_partial = [], []
+        file_ranges = [ (ph.offset, ph.offset+ph.filesz) for ph in phs ]
+        mem_ranges  = [ (ph.vaddr,  ph.vaddr+ph.memsz)   for ph in phs ]
+        starts = intervals_containing(file_ranges,
+                                      [s.sh.offset for s in sections])
+        ends   = intervals_containing(file_ranges,
+                                      [s.sh.offset+s.sh.size for s in sections])
+        addrs  = intervals_containing(mem_ranges,
+                                      [s.sh.addr for s in sections])
+        all_ph = list(range(len(phs)))
+        for idx, s in enumerate(sections):
+            sh = s.sh
+            if sh.type != elf.SHT_NOBITS: candidates = starts[idx]
+            elif sh.flags & elf.SHF_ALLOC: candidates = addrs[idx]
+            else:                          candidates = all_ph
+            tbss = (sh.flags & elf.SHF_TLS) and sh.type == elf.SHT_NOBITS
+            inside = []
+            for i in candidates:
+                if tbss and phs[i].type != elf.PT_TLS:
+                    # .tbss is special.  It doesn't contribute memory space
+                    # to normal segments.
+                    continue
+                if section_in_segment(sh, phs[i]):
+                    s.phparent = self.phlist[i]
+                    self.phlist[i].shlist.append(s)
+                    inside.append(i)
+            for i in sorted(set(starts[idx] + ends[idx])):
+                if i in inside or (tbss and phs[i].type != elf.PT_TLS):
+                    continue
+                start, end = file_ranges[i]
+                if start <= sh.offset < end or \
+                   start < sh.offset+sh.size <= end:
+                    self.phlist[i].shlist_partial.append(s)
 
     def __getitem__(self, item):
         return self.phlist[item]
@@ -521,7 +1215,13 @@ class PHList(object):
         for p in self.phlist:
             c += p.ph.pack()
         return c
+    def pack_into(self, buf, off):
+        for p in self.phlist:
+            off = p.ph.pack_into(buf, off)
+        return off
+    bytelen = property(lambda _: sum([p.ph.bytelen for p in _.phlist]))
     def resize(self, sec, diff):
+        self.parent._vad_index = None
         for p in self.phlist:
             if p.ph.offset > sec.sh.offset:
                 p.ph.offset += diff
@@ -531,6 +1231,292 @@ class PHList(object):
                 p.ph.paddr += diff
 
 
+### Dynamic Segment
+
+class DynamicView(object):
+    """
+    Dynamic linking view of an executable or a shared object, built from
+    the PT_DYNAMIC segment instead of the section headers, e.g. for a
+    file without section header table (sstrip) or to avoid reading them.
+    The tables are found by their address in the dynamic entries, in the
+    PT_LOAD segments, as the dynamic loader does. The number of symbols
+    is given by the hash tables.
+    Each table is a section that is not in the section list, only read
+    when it is accessed: dynamic, dynstr, dynsym, hash, gnu_hash, rel
+    (DT_RELA or DT_REL) and jmprel (DT_JMPREL); None if not present.
+    'dt' is the value of the first dynamic entry of each tag.
+    """
+    def __init__(self, parent, ph):
+        self.parent = parent
+        inheritsexwsize(self, parent, {})
+        self._shstrtab = DynamicView.Names()
+        self.shlist = [ NullSection(self) ]
+        self.dynstr = self.dynsym = self.hash = self.gnu_hash = None
+        self.rel = self.jmprel = None
+        self.dynamic = self.add_section(Dynamic, '.dynamic',
+            ph.vaddr, ph.filesz, offset=ph.offset)
+        d = {}
+        for dyn in self.dynamic.dyntab:
+            if dyn.type == elf.DT_NULL:
+                break
+            d.setdefault(dyn.type, dyn.name_idx)
+        self.dt = d
+        if elf.DT_STRTAB in d:
+            self.dynstr = self.add_section(StrTable, '.dynstr',
+                d[elf.DT_STRTAB], d.get(elf.DT_STRSZ, 0))
+            self.dynamic.sh.link = self.dynstr._idx
+        if elf.DT_SYMTAB in d:
+            self.dynsym = self.add_section(DynSymTable, '.dynsym',
+                d[elf.DT_SYMTAB], 0, entsize=d.get(elf.DT_SYMENT, 0),
+                link=self.dynamic.sh.link)
+        if elf.DT_HASH in d:
+            # Words are 32-bit, except for a few 64-bit architectures
+            entsize = 4
+            if self.wsize == 64 and \
+                    parent.Ehdr.machine in (elf.EM_ALPHA, elf.EM_S390):
+                entsize = 8
+            fmt = {4: 'I', 8: 'Q'}[entsize]
+            nbucket, nchain = struct.unpack(self.sex+fmt*2,
+                self.read(d[elf.DT_HASH], 2*entsize))
+            self.hash = self.add_section(HashSection, '.hash',
+                d[elf.DT_HASH], (2+nbucket+nchain)*entsize, entsize=entsize)
+            nsyms = nchain
+        if elf.DT_GNU_HASH in d:
+            ad = d[elf.DT_GNU_HASH]
+            nbuckets, symoffset, bloom_size, bloom_shift = \
+                struct.unpack(self.sex+"IIII", self.read(ad, 16))
+            ad_buckets = ad + 16 + bloom_size*self.wsize//8
+            ad_chains = ad_buckets + nbuckets*4
+            buckets = struct.unpack(self.sex+"I"*nbuckets,
+                self.read(ad_buckets, nbuckets*4))
+            # The symbols of the last chain are the last ones; an empty
+            # bucket is 0
+            count = max((0,) + buckets)
+            if count < symoffset:
+                count = symoffset
+            else:
+                while True:
+                    h, = struct.unpack(self.sex+"I",
+                        self.read(ad_chains+(count-symoffset)*4, 4))
+                    count += 1
+                    if h & 1:
+                        break
+            self.gnu_hash = self.add_section(GNUHashSection, '.gnu.hash',
+                ad, ad_chains+(count-symoffset)*4-ad)
+            if self.hash is None:
+                nsyms = count
+        for h in (self.hash, self.gnu_hash):
+            if h is not None and self.dynsym is not None:
+                h.sh.link = self.dynsym._idx
+        if self.dynsym is not None:
+            sh = self.dynsym.sh
+            if self.hash is None and self.gnu_hash is None:
+                # The symbol table usually precedes the string table
+                nsyms = 0
+                if self.dynstr is not None and self.dynstr.sh.addr > sh.addr:
+                    nsyms = (self.dynstr.sh.addr-sh.addr)//sh.entsize
+                log.warn("No hash table, %d dynamic symbols are guessed", nsyms)
+            sh.size = nsyms*sh.entsize
+            sh.offset = self.offset(sh.addr, sh.size)
+            self.dynsym.content = self.content(sh.offset, sh.size)
+        if elf.DT_RELA in d:
+            self.rel = self.add_section(RelATable, '.rela.dyn',
+                d[elf.DT_RELA], d.get(elf.DT_RELASZ, 0),
+                entsize=d.get(elf.DT_RELAENT, 0))
+        elif elf.DT_REL in d:
+            self.rel = self.add_section(RelTable, '.rel.dyn',
+                d[elf.DT_REL], d.get(elf.DT_RELSZ, 0),
+                entsize=d.get(elf.DT_RELENT, 0))
+        if elf.DT_JMPREL in d:
+            if d.get(elf.DT_PLTREL) == elf.DT_RELA:
+                cls, name = RelATable, '.rela.plt'
+            else:
+                cls, name = RelTable, '.rel.plt'
+            self.jmprel = self.add_section(cls, name,
+                d[elf.DT_JMPREL], d.get(elf.DT_PLTRELSZ, 0))
+        for r in (self.rel, self.jmprel):
+            if r is not None and self.dynsym is not None:
+                r.sh.link = self.dynsym._idx
+
+    class Names(object):
+        # Names of the sections, there is no .shstrtab
+        def __init__(self):
+            self.names = [ '' ]
+        def get_name(self, idx):
+            return self.names[idx]
+        def add_name(self, name):
+            self.names.append(name)
+            return len(self.names)-1
+
+    def add_section(self, cls, name, addr, size, offset=None, **kargs):
+        if offset is None:
+            offset = self.offset(addr, size)
+        s = cls(self, addr=addr, offset=offset, size=size,
+                flags=elf.SHF_ALLOC, **kargs)
+        if s.sh.entsize == 0 and isinstance(s, (SymTable, RelTable)):
+            if isinstance(s, SymTable):
+                entry = { 32: elf.Sym32, 64: elf.Sym64 }[self.wsize]
+            else:
+                entry = s.entry_class
+            s.sh.entsize = entry._get_layout(self.sex, self.wsize).size
+        s.sh.name = name
+        s.content = self.content(offset, size)
+        s._idx = len(self.shlist)
+        self.shlist.append(s)
+        return s
+    def offset(self, ad, size=0):
+        # File offset of the address 'ad', in a PT_LOAD segment
+        for p in self.parent.ph:
+            if p.ph.type == elf.PT_LOAD and \
+                    p.ph.vaddr <= ad and ad+size <= p.ph.vaddr+p.ph.filesz:
+                return ad - p.ph.vaddr + p.ph.offset
+        raise ValueError("Address %#x is not in the file" % ad)
+    def read(self, ad, size):
+        off = self.offset(ad, size)
+        return self.parent.content[off:off+size]
+    def content(self, off, size):
+        # A view of the file, which is only copied when it is modified
+        return StrPatchwork(ContentView(self.parent.content, off, off+size))
+    def __getitem__(self, item):
+        return self.shlist[item]
+    def resize(self, sec, diff):
+        raise ValueError("Sections of the dynamic segment cannot be resized")
+
+    def needed(self):
+        # Names of the libraries in DT_NEEDED entries
+        return [ dyn.name for dyn in self.dynamic.dyntab
+                 if dyn.type == elf.DT_NEEDED ]
+    needed = property(needed)
+    def lookup(self, name):
+        """ Dynamic symbol of a given name, or None; see DynSymTable """
+        if self.dynsym is None:
+            return None
+        return self.dynsym.lookup(name)
+
+### Core File
+
+class CoreFile(object):
+    """
+    Memory of the process, and its state when it crashed, from a core
+    file (ET_CORE); the file should be read with ELF.from_path, then
+    it is mapped and only the pages that are read are loaded.
+    read() returns a copy of the bytes at some addresses, view() a
+    window on the file, where nothing is copied.
+    The PT_LOAD segments are sorted by address, to find the one that
+    contains an address in O(log n); their part after filesz, up to
+    memsz (e.g. read-only pages that were not dumped), reads as zeros.
+    From the notes of the PT_NOTE segments:
+      threads: Prstatus of each thread, where 'regs' is a dictionary
+               of the registers (r0, r1, ... if their names are unknown)
+      files:   (start, end, offset, name) of each mapped file (NT_FILE)
+      auxv:    (type, value) pairs of the auxiliary vector (NT_AUXV)
+    """
+    def __init__(self, e):
+        self.parent = e
+        inheritsexwsize(self, e, {})
+        loads = [ p for p in e.ph
+                  if p.ph.type == elf.PT_LOAD and p.ph.memsz > 0 ]
+        loads.sort(key=lambda p: p.ph.vaddr)
+        self.segments = loads
+        self.starts = [ p.ph.vaddr for p in loads ]
+        self.ends = [ p.ph.vaddr + p.ph.memsz for p in loads ]
+        self.threads, self.files, self.auxv = [], [], []
+        for p in e.ph:
+            for type, name, desc in p.iter_notes():
+                if type == elf.NT_PRSTATUS:
+                    self.threads.append(self.decode_prstatus(desc))
+                elif type == elf.NT_FILE:
+                    self.files = self.decode_file(desc)
+                elif type == elf.NT_AUXV:
+                    self.auxv = self.decode_auxv(desc)
+        self._file_starts = [ f[0] for f in self.files ]
+
+    def words(self, desc, count, start=0):
+        # 'count' words of the size of the ELF class
+        w = {32: 'I', 64: 'Q'}[self.wsize]
+        return struct.unpack_from(self.sex+w*count, desc, start)
+    def decode_prstatus(self, desc):
+        pr = elf.Prstatus(parent=self, content=desc)
+        ws = self.wsize//8
+        # pr_reg is followed by pr_fpvalid, padded to a word
+        nregs = (len(desc) - pr.bytelen - ws) // ws
+        regs = self.words(desc, nregs, pr.bytelen)
+        names = elf.prstatus_regs.get(self.parent.Ehdr.machine, ())
+        if len(names) != nregs:
+            names = [ 'r%d' % _ for _ in range(nregs) ]
+        pr.regs = dict(zip(names, regs))
+        return pr
+    def decode_file(self, desc):
+        ws = self.wsize//8
+        count, page_size = self.words(desc, 2)
+        ranges = self.words(desc, 3*count, 2*ws)
+        names = desc[(2+3*count)*ws:].split(data_null)
+        return [ (ranges[3*i], ranges[3*i+1], ranges[3*i+2]*page_size,
+                  bytes_to_name(names[i])) for i in range(count) ]
+    def decode_auxv(self, desc):
+        values = self.words(desc, len(desc)//(self.wsize//8))
+        auxv = []
+        for i in range(0, len(values)-1, 2):
+            if values[i] == elf.AT_NULL:
+                break
+            auxv.append((values[i], values[i+1]))
+        return auxv
+
+    def find(self, ad):
+        """ PT_LOAD segment containing the address 'ad', or None """
+        i = bisect_right(self.starts, ad) - 1
+        if i < 0 or ad >= self.ends[i]:
+            return None
+        return self.segments[i]
+    def read(self, ad, size):
+        """ Memory content at [ad:ad+size], which may span contiguous
+        segments; ValueError if some part is not in a segment """
+        res = []
+        end = ad + size
+        i = bisect_right(self.starts, ad) - 1
+        while ad < end:
+            if i < 0 or i >= len(self.starts) \
+                    or not self.starts[i] <= ad < self.ends[i]:
+                raise ValueError("Address %#x is not in the core file" % ad)
+            ph = self.segments[i].ph
+            stop = min(end, self.ends[i])
+            # The part in the file, then zeros
+            fstop = max(ad, min(stop, ph.vaddr + ph.filesz))
+            if ad < fstop:
+                off = ph.offset - ph.vaddr
+                res.append(self.parent.content[off+ad:off+fstop])
+            if fstop < stop:
+                res.append(data_null*(stop-fstop))
+            ad = stop
+            i += 1
+        if len(res) == 1:
+            return res[0]
+        return data_empty.join(res)
+    def view(self, ad, size):
+        """ ContentView of the file, for the memory at [ad:ad+size];
+        ValueError if it is not in the file part of one segment. The
+        bytes are only read from the file when the view is sliced """
+        i = bisect_right(self.starts, ad) - 1
+        if i >= 0:
+            ph = self.segments[i].ph
+            if ph.vaddr <= ad and ad+size <= ph.vaddr + ph.filesz:
+                off = ph.offset - ph.vaddr
+                return ContentView(self.parent.content, off+ad, off+ad+size)
+        raise ValueError("Addresses %#x-%#x are not in the file part of a segment"
+                         % (ad, ad+size))
+    def __getitem__(self, item):
+        if type(item) is not slice:
+            return self.read(item, 1)
+        return self.read(item.start, item.stop-item.start)
+    def mapped_file(self, ad):
+        """ (name, offset) of the file mapped at address 'ad', from the
+        NT_FILE note, or None """
+        i = bisect_right(self._file_starts, ad) - 1
+        if i < 0 or ad >= self.files[i][1]:
+            return None
+        start, end, offset, name = self.files[i]
+        return name, offset + ad - start
+
 class virt(object):
     def __init__(self, x):
         self.parent = x
@@ -580,10 +1566,12 @@ class virt(object):
                 continue
             if not type(n_item) is slice:
                 n_item = slice(n_item, n_item+1)
-            start = n_item.start + s.ph.offset
-            stop  = n_item.stop + s.ph.offset
-            n_item = slice(start, stop)
-            data_out += self.parent.content[n_item]
+            # After filesz, up to memsz, the segment is filled with zeros
+            stop = min(n_item.stop, s.ph.filesz)
+            if n_item.start < stop:
+                data_out += self.parent.content[
+                    n_item.start+s.ph.offset:stop+s.ph.offset]
+            data_out += data_null*(n_item.stop-max(n_item.start, stop))
         return data_out
 
     def __setitem__(self, item, data):
@@ -650,6 +1638,199 @@ class virt(object):
             offset = 0
         return -1
 
+class VadIndex(object):
+    """
+    Index of the address ranges of the sections and of the segments,
+    to find which one contains an address in O(log n).
+    The addresses are cut at each start or end of a range; for each
+    piece, the answer of getsectionbyvad is computed once, with a
+    sweep over the sorted bounds.
+    """
+    _mismatch = object()
+    def __init__(self, sh, ph):
+        events = {}
+        for kind, lst in (('sh', sh), ('ph', ph)):
+            for idx, s in enumerate(lst):
+                if s.size <= 0:
+                    continue
+                events.setdefault(s.addr, []).append((True, kind, idx, s))
+                events.setdefault(s.addr+s.size, []).append((False, kind, idx, s))
+        self.bounds = sorted(events)
+        self.answers = []
+        # Active ranges; the smallest index of each category is found
+        # with a heap, where the ranges that ended are removed lazily
+        active = {'sh': set(), 'ph': set()}
+        heaps = {'sh': [], 'ph': [], 'text': [], 'text*': []}
+        objs = {'sh': {}, 'ph': {}}
+        def first(h, kind):
+            while h and not h[0] in active[kind]:
+                heapq.heappop(h)
+            if h: return objs[kind][h[0]]
+            return None
+        for ad in self.bounds:
+            for start, kind, idx, s in events[ad]:
+                if not start:
+                    active[kind].discard(idx)
+            for start, kind, idx, s in events[ad]:
+                if not start:
+                    continue
+                active[kind].add(idx)
+                objs[kind][idx] = s
+                heapq.heappush(heaps[kind], idx)
+                if kind == 'sh' and s.sh.name == '.text':
+                    heapq.heappush(heaps['text'], idx)
+                if kind == 'sh' and s.sh.name.startswith('.text'):
+                    heapq.heappush(heaps['text*'], idx)
+            nsh, nph = len(active['sh']), len(active['ph'])
+            res = None
+            if nsh == 1 and nph == 1:
+                res = first(heaps['sh'], 'sh')
+                if not res in first(heaps['ph'], 'ph').shlist:
+                    res = self._mismatch
+            elif nsh == 1 and nph > 1:
+                res = first(heaps['sh'], 'sh')
+            elif nsh == 0 and nph == 1:
+                res = first(heaps['ph'], 'ph')
+            elif nph == 0 and nsh > 1:
+                # Relocatable: the priority given to .text is heuristic
+                res = first(heaps['text'], 'sh')
+                if res is None: res = first(heaps['text*'], 'sh')
+                if res is None: res = first(heaps['sh'], 'sh')
+            self.answers.append(res)
+    def lookup(self, ad):
+        i = bisect_right(self.bounds, ad) - 1
+        if i < 0:
+            return None
+        res = self.answers[i]
+        if res is self._mismatch:
+            raise ValueError("Mismatch: section not in segment")
+        return res
+
+class Symbolizer(object):
+    """
+    Finds which symbol contains an address, e.g. to symbolize sampled
+    program counters; built from all symbol tables of an ELF file, with
+    the allocated sections as a fallback.
+    The answer is (name, offset, section), where name is None and the
+    offset is relative to the section if no symbol contains the address,
+    or None if the address is not in any section. The symbols are those
+    of .symtab, or of .dynsym if the file is stripped.
+    A symbol of size 0 ends at the next symbol or at the end of its
+    section; if symbols are nested, the one that starts last is chosen.
+    As with getsectionbyvad, the addresses are cut at each bound of a
+    symbol or section, and the answer for each piece is computed once,
+    with a sweep over the sorted bounds.
+    """
+    types = (elf.STT_NOTYPE, elf.STT_OBJECT, elf.STT_FUNC,
+             elf.STT_LOOS) # STT_GNU_IFUNC
+    def __init__(self, e):
+        self.parent = e
+        ranges = []
+        sections = {}
+        for idx, s in enumerate(e.sh):
+            if not s.sh.flags & elf.SHF_ALLOC or s.size <= 0:
+                continue
+            sections[idx] = s
+            # Sections are chosen last
+            ranges.append((s.addr, s.addr+s.size, 1, -idx, None, s))
+        # .dynsym is only used if the file is stripped
+        symtabs = [_ for _ in e.sh if isinstance(_, SymTable)]
+        if [_ for _ in symtabs if _.sh.type == elf.SHT_SYMTAB]:
+            symtabs = [_ for _ in symtabs if _.sh.type == elf.SHT_SYMTAB]
+        syms = []
+        for symtab in symtabs:
+            for value, size, info, shndx, name_idx in self._raw_symbols(symtab):
+                if shndx in sections and (info&0xf) in self.types:
+                    syms.append((value, size, shndx, (symtab, name_idx)))
+        starts = sorted(set([_[0] for _ in syms]))
+        for value, size, shndx, name in syms:
+            s = sections[shndx]
+            if size:
+                end = value + size
+            else:
+                end = s.addr + s.size
+                i = bisect_right(starts, value)
+                if i < len(starts) and starts[i] < end:
+                    end = starts[i]
+            if value < end:
+                ranges.append((value, end, 0, -value, name, s))
+        events = {}
+        for r in ranges:
+            events.setdefault(r[0], []).append(r)
+            events.setdefault(r[1], [])
+        self.bounds = []
+        self.answers = []
+        # Active ranges, the innermost symbol is first in the heap;
+        # ranges that ended are removed lazily. For aliases, the name
+        # with the lowest index in the string table is chosen, then a
+        # counter makes each entry unique: symbol tables and sections
+        # are never compared.
+        heap = []
+        count = 0
+        for ad in sorted(events):
+            for r in events[ad]:
+                if r[4] is None: name_idx = 0
+                else:            name_idx = r[4][1]
+                heapq.heappush(heap, (r[2], r[3], r[1], name_idx, count,
+                                      r[0], r[4], r[5]))
+                count += 1
+            while heap and heap[0][2] <= ad:
+                heapq.heappop(heap)
+            if heap:
+                res = heap[0][5:]
+            else:
+                res = None
+            if self.answers and self.answers[-1] == res:
+                continue
+            self.bounds.append(ad)
+            self.answers.append(res)
+        self._names = [None] * len(self.answers)
+    def _raw_symbols(self, symtab):
+        # (value, size, info, shndx, name_idx) of each symbol; symbols
+        # that are not yet decoded are read with one struct.unpack
+        entries = symtab.symtab
+        layout = entries.cls._get_layout(symtab.sex, symtab.wsize)
+        pos = [ layout.names.index(_)
+                for _ in ('value', 'size', 'info', 'shndx', 'name_idx') ]
+        sz = entries.entsize
+        c = symtab.content.pack()
+        unpack = layout.struct.unpack_from
+        for idx, sym in enumerate(entries._elts):
+            if sym is not None:
+                yield sym.value, sym.size, sym.info, sym.shndx, sym.name_idx
+            elif sz >= layout.size and (idx+1)*sz <= len(c):
+                f = unpack(c, idx*sz)
+                yield tuple([f[_] for _ in pos])
+            else:
+                sym = entries[idx]
+                yield sym.value, sym.size, sym.info, sym.shndx, sym.name_idx
+    def _answer(self, i, ad):
+        if i < 0:
+            return None
+        res = self.answers[i]
+        if res is None:
+            return None
+        name = self._names[i]
+        if name is None and res[1] is not None:
+            # Names are read when they are needed for the first time
+            symtab, name_idx = res[1]
+            name = self._names[i] = symtab.linksection.get_name(name_idx)
+        return (name, ad-res[0], res[2])
+    def lookup(self, ad):
+        return self._answer(bisect_right(self.bounds, ad)-1, ad)
+    def lookup_many(self, ads):
+        """ Same as [ lookup(ad) for ad in ads ], but the addresses are
+        sorted and the index is walked once, from left to right """
+        ads = list(ads)
+        res = [None] * len(ads)
+        bounds, answer = self.bounds, self._answer
+        i = 0
+        for q in sorted(range(len(ads)), key=ads.__getitem__):
+            ad = ads[q]
+            i = bisect_right(bounds, ad, i)
+            res[q] = answer(i-1, ad)
+        return res
+
 def elf_default_content(self, **kargs):
     if self.Ehdr.type == elf.ET_REL:
         elf_default_content_reloc(self, **kargs)
@@ -737,6 +1918,7 @@ def elf_default_content_reloc(self, **kargs):
     # elf_set_offsets() should take care of that
 
 def elf_set_offsets(self):
+    self._vad_index = None
     if self.Ehdr.type != elf.ET_REL:
         # TODO
         return
@@ -777,6 +1959,9 @@ def elf_set_offsets(self):
 class ELF(object):
     def __init__(self, elfstr = None, **kargs):
         self._virt = virt(self)
+        self._vad_index = None
+        self._reloc_index = None
+        self._dynamic_view = None
         if elfstr is None:
             # Create an ELF file, with default header values
             # kargs can supersede these default values
@@ -803,6 +1988,13 @@ class ELF(object):
         self.parse_content()
         self.check_coherency()
 
+    # Content read from a file, given by its path or as a file object,
+    # which is mapped in memory instead of being copied
+    def from_path(cls, f, *args, **kargs):
+        return cls(mmap_file(f), *args, **kargs)
+    from_path = classmethod(from_path)
+    from_fileobj = from_path
+
     def get_virt(self):
         return self._virt
     virt = property(get_virt)
@@ -814,8 +2006,51 @@ class ELF(object):
         self.wsize = h[4]*32
         self.sex   = {1:'<', 2:'>'} [h[5]]
         self.Ehdr = elf.Ehdr(parent=self, content=self.content)
-        self.sh = SHList(self)
-        self.ph = PHList(self)
+        # The section and segment headers are decoded when they are
+        # used for the first time, or before the content is modified
+        self._sh = None
+        self._ph = None
+        self.content._add_view(self)
+        self._vad_index = None
+        self._reloc_index = None
+        self._dynamic_view = None
+    def _parse_headers(self):
+        self._sh = SHList(self)
+        self._ph = PHList(self)
+    def _detach_view(self, start, stop):
+        # Called before the content is modified
+        if self._sh is None:
+            self._parse_headers()
+        return True
+    def get_sh(self):
+        if self._sh is None:
+            self._parse_headers()
+        return self._sh
+    def set_sh(self, sh):
+        self._sh = sh
+    sh = property(get_sh, set_sh)
+    def get_ph(self):
+        if self._sh is None:
+            self._parse_headers()
+        return self._ph
+    def set_ph(self, ph):
+        self._ph = ph
+    ph = property(get_ph, set_ph)
+    def _shdr(self, idx):
+        # Section header decoded alone, as in SHList
+        of = self.Ehdr.shoff + idx*self.Ehdr.shentsize
+        return elf.Shdr(parent=self, content=self[of:of+self.Ehdr.shentsize])
+    def _shdr_types(self):
+        # Types of all the sections, decoded without creating them
+        ehdr = self.Ehdr
+        if not ehdr.shoff:
+            return []
+        layout = elf.Shdr._get_layout(self.sex, self.wsize)
+        if ehdr.shentsize < layout.size:
+            # Padded headers
+            return [ self._shdr(idx).type for idx in range(ehdr.shnum) ]
+        return table_field(self.content, self.sex, layout, 'type',
+                           ehdr.shentsize, ehdr.shnum, ehdr.shoff)
     def resize(self, old, new):
         pass
     def __getitem__(self, item):
@@ -824,25 +2059,20 @@ class ELF(object):
     def build_content(self):
         if self.Ehdr.shoff == 0:
             elf_set_offsets(self)
-        c = StrPatchwork()
-        c[0] = self.Ehdr.pack()
-        c[self.Ehdr.phoff] = self.ph.pack()
+        c = [(0, self.Ehdr), (self.Ehdr.phoff, self.ph)]
         for s in self.sh:
-            c[s.sh.offset] = s.pack()
-        c[self.Ehdr.shoff] = self.sh.pack()
-        return c.pack()
+            c.append((s.sh.offset, s))
+        c.append((self.Ehdr.shoff, self.sh))
+        return pack_parts(c)
 
     def check_coherency(self):
         if self.Ehdr.version != 1:
             raise ValueError("Ehdr version is %d instead of 1"%self.Ehdr.version)
-        symtab_count, dynsym_count, hash_count = 0, 0, 0
-        for sh in self.sh:
-            if sh.sh.type == elf.SHT_SYMTAB:
-                symtab_count += 1
-            if sh.sh.type == elf.SHT_DYNSYM:
-                dynsym_count += 1
-            if sh.sh.type == elf.SHT_HASH:
-                hash_count += 1
+        # Only the section headers that are needed are decoded
+        types = self._shdr_types()
+        symtab_count = types.count(elf.SHT_SYMTAB)
+        dynsym_count = types.count(elf.SHT_DYNSYM)
+        hash_count = types.count(elf.SHT_HASH)
         if symtab_count > 1:
             raise ValueError("Has more than one (%d) sections SYMTAB"% symtab_count)
         if dynsym_count > 1:
@@ -852,10 +2082,15 @@ class ELF(object):
         if self.Ehdr.shstrndx == elf.SHN_UNDEF:
             log.warn("No section (e.g. core file)")
         else:
-            if self.sh[self.Ehdr.shstrndx].sh.type != elf.SHT_STRTAB:
-                log.error("Section of index shstrndx is of type %d instead of %d"%(self.sh[self.Ehdr.shstrndx].sh.type, elf.SHT_STRTAB))
-            elif self.sh[self.Ehdr.shstrndx].sh.name != '.shstrtab':
-                log.error("Section of index shstrndx is of name '%s' instead of '%s'"%(self.sh[self.Ehdr.shstrndx].sh.name, '.shstrtab'))
+            if types[self.Ehdr.shstrndx] != elf.SHT_STRTAB:
+                log.error("Section of index shstrndx is of type %d instead of %d"%(types[self.Ehdr.shstrndx], elf.SHT_STRTAB))
+            elif self._shstrtab_name() != '.shstrtab':
+                log.error("Section of index shstrndx is of name '%s' instead of '%s'"%(self._shstrtab_name(), '.shstrtab'))
+    def _shstrtab_name(self):
+        # Name of the section shstrndx, read in its own content
+        sh = self._shdr(self.Ehdr.shstrndx)
+        data = self[sh.offset:sh.offset+sh.size]
+        return bytes_to_name(data[sh.name_idx:data.find(data_null, sh.name_idx)])
 
     def __str__(self):
         raise AttributeError("Use pack() instead of str()")
@@ -875,30 +2110,60 @@ class ELF(object):
             s = self.getsectionbyname(section)
             if s.sh.addr <= ad < s.sh.addr + s.sh.size:
                 return s
-        sh = [ s for s in self.sh if s.addr <= ad < s.addr+s.size ]
-        ph = [ s for s in self.ph if s.addr <= ad < s.addr+s.size ]
-        if len(sh) == 1 and len(ph) == 1:
-            # Executable returns a section and a PH
-            if not sh[0] in ph[0].shlist:
-                raise ValueError("Mismatch: section not in segment")
-            return sh[0]
-        if len(sh) == 1 and len(ph) > 1:
-            # Executable may also return a section and many PH
-            # e.g. the start of the .got section
-            return sh[0]
-        if len(sh) == 0 and len(ph) == 1:
-            # Core returns a PH
-            return ph[0]
-        if len(ph) == 0 and len(sh) > 1:
-            # Relocatable returns many sections, all at address 0
-            # The priority given to .text is heuristic
-            for s in sh:
-                if s.sh.name == '.text':
-                    return s
-            for s in sh:
-                if s.sh.name.startswith('.text'):
-                    return s
-            return sh[0]
+        # Executable returns a section and a PH, or a section and many
+        # PH (e.g. the start of the .got section); core returns a PH;
+        # relocatable returns many sections, all at address 0.
+        # The index is rebuilt after a section is added or resized.
+        if self._vad_index is None:
+            self._vad_index = VadIndex(self.sh.shlist, self.ph.phlist)
+        return self._vad_index.lookup(ad)
+
+    def getrelocsbyoffset(self, start, stop=None):
+        """ Relocations of all relocation sections at offset 'start', or
+        with an offset in [start:stop], sorted by offset.
+        In executables and shared objects, the offset is an address;
+        in relocatable files, it is relative to the section that is
+        relocated, which is given by sh.info of the relocation section.
+        The index is rebuilt after a relocation section is parsed or
+        a section is added. """
+        if self._reloc_index is None:
+            tables = [ s.offset_index() + (s,)
+                       for s in self.sh if isinstance(s, RelTable) ]
+            merged = list(heapq.merge(*[
+                [ (o, n, _) for o, _ in zip(offsets, order) ]
+                for n, (offsets, order, s) in enumerate(tables) ]))
+            self._reloc_index = ([ _[0] for _ in merged ],
+                                 [ (tables[_[1]][2], _[2]) for _ in merged ])
+        offsets, relocs = self._reloc_index
+        if stop is None:
+            stop = start + 1
+        i = bisect_left(offsets, start)
+        j = bisect_left(offsets, stop, i)
+        return [ s.reltab[idx] for s, idx in relocs[i:j] ]
+
+    def dynamic_view(self):
+        """ DynamicView of the PT_DYNAMIC segment, or None if there is
+        no such segment """
+        if self._dynamic_view is None:
+            for p in self.ph:
+                if p.ph.type == elf.PT_DYNAMIC:
+                    self._dynamic_view = DynamicView(self, p.ph)
+                    break
+        return self._dynamic_view
+
+    def build_id(self):
+        """ Content of the GNU build-id note, or None; found in the note
+        sections, or in the PT_NOTE segments if there is no section.
+        See also build_id(data), which does not parse the whole file """
+        for s in self.sh:
+            if s.sh.type == elf.SHT_NOTE:
+                res = find_build_id(s.iter_notes())
+                if res is not None:
+                    return res
+        for p in self.ph:
+            res = find_build_id(p.iter_notes())
+            if res is not None:
+                return res
         return None
 
     def has_relocatable_sections(self):
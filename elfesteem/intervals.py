@@ -1,81 +1,76 @@
-import sys
-if sys.version_info[0] >= 3:
-    from functools import reduce
+from bisect import bisect_left, bisect_right
 
 class Intervals(object):
     '''
     Represent a subset of the integers, to be used to detect which parts
     of the file have been parsed
+    It is stored as two sorted lists, the starts and the stops of
+    disjoint ranges, which are found by dichotomy.
     '''
     def __init__(self):
-        self.ranges = [ ]
+        self._starts = [ ]
+        self._stops = [ ]
     def __str__(self):
-        if len(self.ranges) == 0: return "[]"
-        return reduce(lambda x, y: x+" "+y,
-               map(lambda x: "[%s:%s]"%(x.start,x.stop), self.ranges))
-    # Internal methods to make object manipulation easier
-    def _split(self, *poslist):
-        def _split_slice(l, s):
-            for pos in sorted(poslist):
-                if s.start < pos < s.stop:
-                    l.append(slice(s.start, pos))
-                    s = slice(pos, s.stop)
-            l.append(s)
-            return l
-        self.ranges = reduce(_split_slice, self.ranges, [])
-    def _merge(self):
-        def _merge_two_slices(l, s):
-            if len(l) and (l[-1].stop == s.start):
-                l[-1] = slice(l[-1].start, s.stop)
-            else:
-                l.append(s)
-            return l
-        self.ranges = reduce(_merge_two_slices, self.ranges, [])
+        if len(self._starts) == 0: return "[]"
+        return " ".join(["[%s:%s]"%x for x in self.iter_ranges()])
+    def ranges(self):
+        return [ slice(*x) for x in self.iter_ranges() ]
+    ranges = property(ranges)
     # Interface of the class
+    def iter_ranges(self):
+        ''' Generates the (start, stop) of each range '''
+        return zip(self._starts, self._stops)
+    def gaps(self, start, stop):
+        ''' Generates the (start, stop) of the ranges between start and
+        stop that are not in the set '''
+        i = bisect_right(self._stops, start)
+        pos = start
+        while i < len(self._starts) and self._starts[i] < stop:
+            if pos < self._starts[i]:
+                yield (pos, self._starts[i])
+            pos = self._stops[i]
+            i += 1
+        if pos < stop:
+            yield (pos, stop)
     def __iter__(self):
-        for s in self.ranges:
-            for t in range(s.start, s.stop):
+        for start, stop in self.iter_ranges():
+            for t in range(start, stop):
                 yield t
     def contains(self, start, stop):
-        for s in self.ranges:
-            if s.start <= start and stop <= s.stop:
-                return True
-        return False
+        i = bisect_right(self._starts, start) - 1
+        return i >= 0 and stop <= self._stops[i]
     def excludes(self, start, stop):
-        if len(self.ranges) == 0:
-            return True
-        if stop <= self.ranges[0].start:
-            return True
-        if self.ranges[-1].stop <= start:
-            return True
-        for i in range(len(self.ranges)-1):
-            if self.ranges[i].stop <= start and stop <= self.ranges[i+1].start:
-                return True
-        return False
+        # First range that ends after start
+        i = bisect_right(self._stops, start)
+        return i == len(self._starts) or stop <= self._starts[i]
     def delete(self, start, stop):
-        def _remove_slices(l, s):
-            if start > s.start or stop < s.stop:
-                l.append(s)
-            return l
-        self._split(start, stop)
-        self.ranges = reduce(_remove_slices, self.ranges, [])
+        if start >= stop:
+            return self
+        # Ranges [i:j] intersect [start:stop]
+        i = bisect_right(self._stops, start)
+        j = bisect_left(self._starts, stop)
+        if i < j:
+            starts, stops = [], []
+            if self._starts[i] < start:
+                starts.append(self._starts[i])
+                stops.append(start)
+            if stop < self._stops[j-1]:
+                starts.append(stop)
+                stops.append(self._stops[j-1])
+            self._starts[i:j] = starts
+            self._stops[i:j] = stops
         return self
     def add(self, start, stop):
-        if len(self.ranges) == 0:
-            self.ranges.append(slice(start, stop))
+        if start >= stop:
             return self
-        self._split(start, stop)
-        def _add_slice(l, s):
-            if len(l) and l[-1].start <= start < s.start:
-                if l[-1].start == start:
-                    l[-1] = slice(start, stop)
-                else:
-                    l.append(slice(start, stop))
-            if s.stop <= start or stop <= s.start:
-                l.append(s)
-            return l
-        self.ranges = reduce(_add_slice, self.ranges, [])
-        self._merge()
+        # Ranges [i:j] intersect or touch [start:stop], they are merged
+        i = bisect_left(self._stops, start)
+        j = bisect_right(self._starts, stop)
+        if i < j:
+            start = min(start, self._starts[i])
+            stop = max(stop, self._stops[j-1])
+        self._starts[i:j] = [start]
+        self._stops[i:j] = [stop]
         return self
 
 if __name__ == "__main__":
@@ -108,3 +103,4 @@ if __name__ == "__main__":
     print(i)
     for k in i:
         print(k)
+    print(list(i.gaps(0, 40)))
@@ -6,8 +6,9 @@ from elfesteem import cstruct
 from elfesteem import macho
 from elfesteem.macho import bytes_to_name, name_to_bytes
 from elfesteem.cstruct import data_empty, data_null
-from elfesteem.strpatchwork import StrPatchwork
+from elfesteem.strpatchwork import StrPatchwork, mmap_file, pack_parts
 from elfesteem import intervals
+import re
 import copy
 #import traceback
 
@@ -609,14 +610,12 @@ class MachoList(object):
                           intervals.Intervals().add(0,farch.size))
             macho.offset = farch.offset
             self.macholist.append(macho)
-            inverse = intervals.Intervals().add(0,farch.size)
-            for j in macho.interval.ranges:
-                inverse.delete(j.start,j.stop)
             if not self.parent.interval == None:
-                for j in inverse.ranges:
-                    if not parent.interval.contains(farch.offset+j.start,farch.offset+j.stop):
+                # Parts of this architecture that have been parsed
+                for start, stop in macho.interval.gaps(0,farch.size):
+                    if not parent.interval.contains(farch.offset+start,farch.offset+stop):
                         raise ValueError("This part of file has already been parsed")
-                    parent.interval.delete(farch.offset+j.start,farch.offset+j.stop)
+                    parent.interval.delete(farch.offset+start,farch.offset+stop)
     def __getitem__(self, item):
         return self.macholist[item]
     def __str__(self):
@@ -1202,6 +1201,13 @@ class MACHO(object):
         if parseSymbols and hasattr(self, 'Mhdr'):
             self.parse_symbols()
         self._virt = virt(self)
+
+    # Content read from a file, given by its path or as a file object,
+    # which is mapped in memory instead of being copied
+    def from_path(cls, f, *args, **kargs):
+        return cls(mmap_file(f), *args, **kargs)
+    from_path = classmethod(from_path)
+    from_fileobj = from_path
     def get_virt(self):
         return self._virt
     virt = property(get_virt)
@@ -1270,28 +1276,18 @@ class MACHO(object):
     
     def pack(self):
         if hasattr(self,'Mhdr'):
-            c = StrPatchwork()
-            mhdr = self.Mhdr.pack()
-            c[0] = mhdr
-            offset = len(mhdr)
-            c[offset] = self.lh.pack()
+            c = [(0, self.Mhdr), (self.Mhdr.bytelen, self.lh.pack())]
             for s in self.sect.sect:
                 if not s.__class__.__name__== 'Encryption':
-                    c[s.offset] = s.pack()
-            for offset, data in self.rawdata:
-                c[offset] = data
-            return c.pack()
+                    c.append((s.offset, s.pack()))
+            c.extend(self.rawdata)
+            return pack_parts(c)
         elif hasattr(self,'Fhdr'):
-            c = StrPatchwork()
-            fhdr = self.Fhdr.pack()
-            c[0] = fhdr
-            offset = len(fhdr)
-            c[offset] = self.fh.pack()
+            c = [(0, self.Fhdr), (self.Fhdr.bytelen, self.fh.pack())]
             for macho in self.arch.macholist:
-                c[macho.offset] = macho.pack()
-            for offset, data in self.rawdata:
-                c[offset] = data
-            return c.pack()
+                c.append((macho.offset, macho.pack()))
+            c.extend(self.rawdata)
+            return pack_parts(c)
     def __str__(self):
         raise AttributeError("Use pack() instead of str()")
     
@@ -1445,14 +1441,17 @@ class MACHO(object):
                                     result.append((pos,val))
             return result
 
+    # Runs of non-null bytes
+    not_null = re.compile(name_to_bytes('[^\x00]+'))
     def checkParsedCompleted(self, **kargs):
         if self.interval == None :
             raise ValueError("No interval argument in macho_init call")
         result = []
-        for i in self.interval :
-            data = self.content[i:i+1]
-            if data != data_null :
-                result.append((i, data))
+        for start, stop in self.interval.iter_ranges():
+            data = self.content[start:stop]
+            for m in self.not_null.finditer(data):
+                for i in range(m.start(), m.end()):
+                    result.append((start+i, data[i:i+1]))
         if 'detect_nop' in kargs and kargs['detect_nop']:
             for pos, val in self.incompletedPosVal():
                 if (pos,val) in result:
@@ -1,7 +1,7 @@
 """
 High-level abstraction of Minidump file
 """
-from strpatchwork import StrPatchwork
+from strpatchwork import StrPatchwork, mmap_file
 import minidump as mp
 
 
@@ -86,6 +86,13 @@ class Minidump(object):
         self.memory = {} # base address (virtual) -> Memory information
         self.build_memory()
 
+    def from_path(cls, f, *args, **kargs):
+        """Minidump read from a file, given by its path or as a file
+        object, which is mapped in memory instead of being copied"""
+        return cls(mmap_file(f), *args, **kargs)
+    from_path = classmethod(from_path)
+    from_fileobj = from_path
+
     def parse_content(self):
         """Build structures corresponding to current content"""
 
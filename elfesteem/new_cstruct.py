@@ -82,11 +82,59 @@ class Cstruct_Metaclass(type):
 
 
 
+        # Unpack plans, computed once for each (sex, wsize)
+        dct['_plans'] = {}
         o = super(Cstruct_Metaclass, cls).__new__(cls, name, bases, dct)
         if name != "CStruct":
             all_cstructs[name] = o
         return o
 
+    def unpack_plan(cls, sex, wsize):
+        """The list of steps needed to unpack the fields of this class:
+          ('fixed', struct, names): consecutive basic types, without count
+          ('array', fmt, size, name, cpt): counted array of a basic type
+          ('sz', name): null terminated string
+          ('struct', class, name, cpt): sub structure, cpt may be None
+          ('custom', f_get, name): field with its own unpacking function
+        """
+        try:
+            return cls._plans[(sex, wsize)]
+        except KeyError:
+            pass
+        plan = []
+        for field in cls._fields:
+            cpt = None
+            if len(field) == 2:
+                fname, ffmt = field
+            elif len(field) == 3:
+                fname, ffmt, cpt = field
+            if ffmt in type_size or (isinstance(ffmt, str) and re.match(r'\d+s', ffmt)):
+                # basic types
+                fmt = real_fmt(ffmt, wsize)
+                if cpt:
+                    plan.append(('array', fmt, struct.calcsize(fmt), fname, cpt))
+                elif len(plan) and plan[-1][0] == 'fixed':
+                    plan[-1][1].append(fmt)
+                    plan[-1][2].append(fname)
+                else:
+                    plan.append(('fixed', [fmt], [fname]))
+            elif ffmt == "sz": # null terminated special case
+                plan.append(('sz', fname))
+            elif ffmt in all_cstructs:
+                # sub structures
+                plan.append(('struct', all_cstructs[ffmt], fname, cpt))
+            elif isinstance(ffmt, tuple):
+                f_get, f_set = ffmt
+                plan.append(('custom', f_get, fname))
+            else:
+                raise ValueError('unknown class', ffmt)
+        for i, step in enumerate(plan):
+            if step[0] == 'fixed':
+                plan[i] = ('fixed', struct.Struct(sex+"".join(step[1])),
+                           tuple([CStruct._prefix+x for x in step[2]]))
+        cls._plans[(sex, wsize)] = plan
+        return plan
+
     def unpack_l(cls, s, off = 0, parent_head = None, _sex=None, _wsize=None):
         if _sex == None and _wsize == None:
             # get sex and size from parent
@@ -101,60 +149,54 @@ class Cstruct_Metaclass(type):
             parent_head = c
         c.parent_head = parent_head
 
-        of1 = off
-        for field in c._fields:
-            cpt = None
-            of2 = of1
-            if len(field) == 2:
-                fname, ffmt = field
-            elif len(field) == 3:
-                fname, ffmt, cpt = field
-            if ffmt in type_size or (isinstance(ffmt, str) and re.match(r'\d+s', ffmt)):
-                # basic types
-                if cpt:
-                    value = []
-                    i = 0
-                    while i < cpt(c):
-                        fmt = real_fmt(ffmt, _wsize)
-                        of2 = of1+struct.calcsize(fmt)
-                        value.append(struct.unpack(c.sex+fmt, s[of1:of2])[0])
-                        of1 = of2
-                        i+=1
+        of = off
+        for step in cls.unpack_plan(c.sex, _wsize):
+            kind = step[0]
+            if kind == 'fixed':
+                _, st, attrs = step
+                for n, v in zip(attrs, st.unpack(s[of:of+st.size])):
+                    setattr(c, n, v)
+                of += st.size
+                continue
+            if kind == 'array':
+                _, fmt, size, fname, cpt = step
+                # The count only depends on the fields already unpacked
+                count = cpt(c)
+                if count > 0:
+                    if fmt.endswith('s'): fmt = fmt*count
+                    else:                 fmt = '%d%s'%(count, fmt)
+                    value = list(struct.unpack(c.sex+fmt, s[of:of+size*count]))
+                    of += size*count
                 else:
-                    fmt = real_fmt(ffmt, _wsize)
-                    of2 = of1+struct.calcsize(fmt)
-                    value = struct.unpack(c.sex+fmt, s[of1:of2])[0]
-            elif ffmt == "sz": # null terminated special case
-                of2 = s.find(data_null, of1)
+                    value = []
+            elif kind == 'sz':
+                _, fname = step
+                of2 = s.find(data_null, of)
                 if of2 == -1:
                     raise ValueError('no null char in string!')
-                of2 += 1
-                value = s[of1:of2-1]
-            elif ffmt in all_cstructs:
-                # sub structures
+                value = s[of:of2]
+                of = of2 + 1
+            elif kind == 'struct':
+                _, sub, fname, cpt = step
                 if cpt:
                     value = []
                     i = 0
                     while i < cpt(c):
-                        v, l = all_cstructs[ffmt].unpack_l(s, of1, parent_head, _sex, _wsize)
+                        v, l = sub.unpack_l(s, of, parent_head, _sex, _wsize)
                         v.parent = c
                         value.append(v)
-                        of2 = of1 + l
-                        of1 = of2
+                        of += l
                         i += 1
                 else:
-                    value, l = all_cstructs[ffmt].unpack_l(s, of1, parent_head, _sex, _wsize)
+                    value, l = sub.unpack_l(s, of, parent_head, _sex, _wsize)
                     value.parent = c
-                    of2 = of1 + l
-            elif isinstance(ffmt, tuple):
-                f_get, f_set = ffmt
-                value, of2 = f_get(c, s, of1)
+                    of += l
             else:
-                raise ValueError('unknown class', ffmt)
-            of1 = of2
+                _, f_get, fname = step
+                value, of = f_get(c, s, of)
             setattr(c, CStruct._prefix+fname, value)
 
-        return c, of2-off
+        return c, of-off
 
     def unpack(cls, s, off = 0, parent_head = None, _sex=None, _wsize=None):
         c, l = cls.unpack_l(s, off = off,
@@ -1849,6 +1849,7 @@ class AuxSymbols(CArray):
         return str([_ for _ in self])
 
 class CoffSymbol(CStruct):
+    _compact = True
     _fields = [ ("name_data","8s"),
                 ("value","u32"),
                 ("sectionnumber","u16"),
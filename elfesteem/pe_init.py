@@ -2,7 +2,7 @@
 
 import struct, array
 from elfesteem import pe
-from elfesteem.strpatchwork import StrPatchwork
+from elfesteem.strpatchwork import StrPatchwork, mmap_file
 log = pe.log
 
 
@@ -333,6 +333,13 @@ class PE(object):
         self._sex = '<>'.index(self.sex)
         self._wsize = self.wsize
 
+    # Content read from a file, given by its path or as a file object,
+    # which is mapped in memory instead of being copied
+    def from_path(cls, f, *args, **kargs):
+        return cls(mmap_file(f), *args, **kargs)
+    from_path = classmethod(from_path)
+    from_fileobj = from_path
+
     def isPE(self):
         if not hasattr(self, 'NTsig') or self.NTsig is None:
             return False
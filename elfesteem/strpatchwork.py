@@ -1,78 +1,419 @@
-from array import array
 # To be compatible with python 2 and python 3
 import sys
 import struct
+import mmap
+import weakref
+from bisect import bisect_left, bisect_right
 data_null = struct.pack("B",0)
 data_empty = struct.pack("")
 
+def mmap_file(f):
+    """
+    Maps a file, given by its path or as a file object, in memory.
+    The mapping is read-only, pages are read when they are accessed.
+    """
+    if not hasattr(f, 'fileno'):
+        f = open(f, 'rb')
+        try:
+            return mmap_file(f)
+        finally:
+            f.close()
+    try:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+        # Empty file, cannot be mapped
+        return data_empty
+
+def pack_parts(parts):
+    """
+    'parts' is a list of (offset, data); the result is the same as writing
+    each data at its offset in an empty StrPatchwork, but the total size
+    is computed first and each data is written in place in one buffer.
+    'data' is a bytestring, or an object with an attribute 'bytelen' and
+    a method 'pack_into(buf, off)', e.g. a CStruct or a StrPatchwork.
+    """
+    size = 0
+    for off, data in parts:
+        if hasattr(data, 'pack_into'): end = off + data.bytelen
+        else:                          end = off + len(data)
+        if end > size: size = end
+    buf = bytearray(size)
+    for off, data in parts:
+        if hasattr(data, 'pack_into'):
+            data.pack_into(buf, off)
+        else:
+            if sys.version_info[0] >= 3 and type(data) == str:
+                data = data.encode(encoding="latin1")
+            buf[off:off+len(data)] = data
+    return bytes(buf)
+
+class PatchOverlay(object):
+    """
+    An immutable base (bytes or mmap) and a sorted list of patches,
+    i.e. of non-overlapping extents that replace or extend the base.
+    Memory usage is proportional to the patches, not to the base.
+
+    Each write is journaled, therefore it can be undone.
+    """
+    def __init__(self, base=data_empty):
+        if not isinstance(base, (bytes, mmap.mmap)):
+            base = bytes(base)
+        self.base = base
+        self._starts = [] # Start offsets of the patches
+        self._data = []   # Content of the patches
+        self._len = len(base)
+        self._journal = []
+    def copy(self):
+        o = PatchOverlay(self.base)
+        o._starts = list(self._starts)
+        o._data = list(self._data)
+        o._len = self._len
+        return o
+    def __len__(self):
+        return self._len
+
+    def chunks(self, start=0, stop=None):
+        # Generates the pieces of base and patches in [start:stop]
+        if stop is None or stop > self._len: stop = self._len
+        starts, data = self._starts, self._data
+        idx = bisect_right(starts, start) - 1
+        if idx < 0 or starts[idx] + len(data[idx]) <= start:
+            idx += 1
+        pos = start
+        while pos < stop:
+            if idx < len(starts) and starts[idx] <= pos:
+                d = data[idx]
+                yield d[pos-starts[idx]:stop-starts[idx]]
+                pos = starts[idx] + len(d)
+                idx += 1
+            else:
+                end = stop
+                if idx < len(starts) and starts[idx] < end:
+                    end = starts[idx]
+                yield self.base[pos:end]
+                pos = end
+    def __getitem__(self, item):
+        start, stop, step = item.indices(self._len)
+        if step != 1:
+            return self.tobytes()[item]
+        if not self._starts:
+            return self.base[start:stop]
+        return data_empty.join(self.chunks(start, stop))
+    def tobytes(self):
+        return self[:]
+
+    def extend(self, val):
+        self.write(self._len, val)
+    def write(self, start, val):
+        # Replaces the content at offset 'start'; it can extend the
+        # content, but not beyond its end
+        if not val:
+            return
+        if start > self._len:
+            raise ValueError("PatchOverlay write after the end")
+        if not isinstance(val, bytes):
+            val = bytes(bytearray(val))
+        stop = start + len(val)
+        starts, data = self._starts, self._data
+        # Patches [i:j] overlap the new one, they are merged
+        i = bisect_right(starts, start) - 1
+        if i < 0 or starts[i] + len(data[i]) <= start:
+            i += 1
+        j = bisect_left(starts, stop)
+        new_start = start
+        if i < j and starts[i] < start:
+            new_start = starts[i]
+            val = data[i][:start-starts[i]] + val
+        if i < j and starts[j-1] + len(data[j-1]) > stop:
+            val = val + data[j-1][stop-starts[j-1]:]
+        self._journal.append((i, starts[i:j], data[i:j], self._len))
+        starts[i:j] = [new_start]
+        data[i:j] = [val]
+        if stop > self._len: self._len = stop
+
+    def undo_extent(self):
+        # Range changed by undo(): the patch made by the last write
+        i = self._journal[-1][0]
+        return self._starts[i], self._starts[i] + len(self._data[i])
+    def undo(self):
+        i, old_starts, old_data, old_len = self._journal.pop()
+        self._starts[i:i+1] = old_starts
+        self._data[i:i+1] = old_data
+        self._len = old_len
+    def patches(self):
+        return list(zip(self._starts, self._data))
+    def diff(self):
+        return [ (o, self.base[o:o+len(d)], d) for o, d in self.patches() ]
+
+    def find(self, pattern, start=0, stop=None):
+        # The base is searched, except where a match would overlap
+        # a patch: only these windows are built
+        start, stop, _ = slice(start, stop).indices(self._len)
+        if not self._starts or not pattern:
+            return self.base.find(pattern, start, stop)
+        size = len(pattern)
+        starts, data = self._starts, self._data
+        idx = bisect_right(starts, start) - 1
+        if idx < 0 or starts[idx] + len(data[idx]) <= start:
+            idx += 1
+        pos = start # Matches starting before 'pos' were searched
+        while idx < len(starts) and starts[idx] < stop:
+            lo = max(pos, starts[idx] - size + 1)
+            hi = min(starts[idx] + len(data[idx]) + size - 1, stop)
+            # Matches in the base, that end before the patch
+            r = self.base.find(pattern, pos, min(lo + size - 1, stop))
+            if r != -1: return r
+            # Matches that overlap the patch
+            if lo < hi:
+                r = self[lo:hi].find(pattern)
+                if r != -1: return lo + r
+                pos = max(pos, hi - size + 1)
+            idx += 1
+        if pos >= stop:
+            return -1
+        return self.base.find(pattern, pos, stop)
+    def rfind(self, pattern, start=0, stop=None):
+        start, stop, _ = slice(start, stop).indices(self._len)
+        if not self._starts or not pattern:
+            return self.base.rfind(pattern, start, stop)
+        size = len(pattern)
+        starts, data = self._starts, self._data
+        idx = bisect_left(starts, stop) - 1
+        end = stop # Matches ending after 'end' were searched
+        while idx >= 0 and starts[idx] + len(data[idx]) > start:
+            lo = max(starts[idx] - size + 1, start)
+            hi = min(starts[idx] + len(data[idx]) + size - 1, end)
+            # Matches in the base, that start after the patch
+            r = self.base.rfind(pattern, max(hi - size + 1, start), end)
+            if r != -1: return r
+            # Matches that overlap the patch
+            if lo < hi:
+                r = self[lo:hi].rfind(pattern)
+                if r != -1: return lo + r
+                end = min(end, lo + size - 1)
+            idx -= 1
+        if end <= start:
+            return -1
+        return self.base.rfind(pattern, start, end)
+
+class ContentView(object):
+    """
+    Read-only window [start:stop] on another content, e.g. the part of
+    a file that is a section. Nothing is copied when it is created, only
+    the slices that are read.
+    The content that is viewed should not be modified.
+    """
+    def __init__(self, content, start, stop):
+        self.content = content
+        self.start = start
+        self.stop = stop
+    def __len__(self):
+        return self.stop - self.start
+    def __getitem__(self, item):
+        start, stop, step = item.indices(len(self))
+        if step != 1:
+            return self.tobytes()[item]
+        if stop <= start:
+            return data_empty
+        return self.content[self.start+start:self.start+stop]
+    def tobytes(self):
+        return self.content[self.start:self.stop]
+    def find(self, pattern, start=0, stop=None):
+        start, stop, _ = slice(start, stop).indices(len(self))
+        pos = self.content.find(pattern, self.start+start, self.start+stop)
+        if pos == -1: return -1
+        return pos - self.start
+    def rfind(self, pattern, start=0, stop=None):
+        start, stop, _ = slice(start, stop).indices(len(self))
+        pos = self.content.rfind(pattern, self.start+start, self.start+stop)
+        if pos == -1: return -1
+        return pos - self.start
+
 class StrPatchwork(object):
-    def __init__(self, s=data_empty, paddingbyte=data_null):
+    # The content is a bytearray: it can be modified in place, slices
+    # are made with only one copy, and searches don't need a copy.
+    # With overlay=True, or if the content is a mmap object, the content
+    # is a PatchOverlay, where the initial content is never modified nor
+    # copied, and where patches can be listed and undone.
+    # If the content is a ContentView, it is copied in a bytearray when
+    # it is modified for the first time. If it views another StrPatchwork,
+    # it is also copied just before this other StrPatchwork is modified
+    # where it is viewed: a view never sees the later modifications.
+    # 'version' is incremented by each modification, e.g. to know if
+    # what was computed from the content is obsolete.
+    version = 0
+    _views = None # Weak references to the objects viewing this one
+    def __init__(self, s=data_empty, paddingbyte=data_null, overlay=False):
         if s == None: s = data_empty
-        if isinstance(s, StrPatchwork): s = s.pack()
-        self.s = array("B",s)
-        # cache s to avoid rebuilding str after each find
-        self.s_cache = s
+        if isinstance(s, StrPatchwork): s = s.s
+        if isinstance(s, ContentView) and overlay:
+            s = s.tobytes()
+        if isinstance(s, PatchOverlay):
+            s = s.copy()
+        elif isinstance(s, ContentView):
+            if isinstance(s.content, StrPatchwork):
+                s.content._add_view(self)
+        elif overlay or isinstance(s, mmap.mmap):
+            s = PatchOverlay(s)
+        else:
+            s = bytearray(s)
+        self.s = s
         self.paddingbyte=paddingbyte
     def __str__(self):
-        return self.s.tostring() # Needed for miasm2 :-(
+        return self.pack() # Needed for miasm2 :-(
         raise AttributeError("Use pack() instead of str()")
     def pack(self):
-        return self.s.tostring()
+        if isinstance(self.s, (PatchOverlay, ContentView)):
+            return self.s.tobytes()
+        return bytes(self.s)
+    def iterpack(self):
+        # Same result as pack(), without building the whole bytestring
+        if isinstance(self.s, PatchOverlay):
+            return self.s.chunks()
+        return iter([self.pack()])
+    # Same interface as CBase, to be used by pack_parts
+    bytelen = property(lambda _: len(_.s))
+    def pack_into(self, buf, off):
+        if isinstance(self.s, PatchOverlay):
+            for chunk in self.s.chunks():
+                buf[off:off+len(chunk)] = chunk
+                off += len(chunk)
+            return off
+        if isinstance(self.s, ContentView):
+            data = self.s.tobytes()
+        else:
+            data = self.s
+        buf[off:off+len(data)] = data
+        return off+len(data)
+    def _writable(self):
+        # Copy on first write
+        if isinstance(self.s, ContentView):
+            self.s = bytearray(self.s.tobytes())
+        return self.s
+    def _add_view(self, view):
+        if self._views is None:
+            self._views = []
+        self._views.append(weakref.ref(view))
+    def _detach_views(self, start=0, stop=None):
+        # The views on [start:stop] are detached before it is modified;
+        # a view may create other views when it is detached, e.g. ELF
+        # creates its sections, they are also visited by this loop
+        if not self._views:
+            return
+        views = []
+        for ref in self._views:
+            v = ref()
+            if v is not None and not v._detach_view(start, stop):
+                views.append(ref)
+        self._views = views
+    def _detach_view(self, start, stop):
+        # This object views [start:stop] of a content that will be
+        # modified; returns True if it does not view this content anymore
+        if not isinstance(self.s, ContentView):
+            # Already copied
+            return True
+        if start < self.s.stop and (stop is None or self.s.start < stop):
+            self._writable()
+            return True
+        return False
 
     def __getitem__(self, item):
         s = self.s
         if type(item) is slice:
-            r = s[item]
+            if isinstance(s, (PatchOverlay, ContentView)):
+                r = s[item]
+            elif item.step is None:
+                r = memoryview(s)[item].tobytes()
+            else:
+                r = bytes(s[item])
             end = item.stop
             if end != None and len(s) < end:
                 if item.step is not None:
                     TODO
                 elif len(r) > 0:
                     # We go beyond the end of 's'
-                    r.extend(array("B",self.paddingbyte*(end-len(s))))
+                    r += self.paddingbyte*(end-len(s))
                 else:
                     # We are entirely after the end of 's'
                     start = item.start
                     if start is None: start = 0
-                    r = array("B",self.paddingbyte*(end-start))
-            return r.tostring()
+                    r = self.paddingbyte*(end-start)
+            return r
         else:
             if item > len(s):
                 return self.paddingbyte
+            elif isinstance(s, (PatchOverlay, ContentView)):
+                if item < 0: item += len(s)
+                return s[item:item+1]
             else:
-                return array("B",[s[item]]).tostring()
+                return struct.pack("B", s[item])
     def __setitem__(self, item, val):
         if val == None:
             return
         if sys.version_info[0] >= 3 and type(val) == str:
             val = val.encode(encoding="latin1")
-        val = array("B",val)
         if type(item) is not slice:
             item = slice(item, item+len(val))
         end = item.stop
+        if item.step is None and (item.start or 0) >= 0 \
+                and end is not None and end >= 0:
+            self._detach_views(item.start or 0, end)
+        else:
+            self._detach_views()
+        self._writable()
+        self.version += 1
         l = len(self.s)
+        if isinstance(self.s, PatchOverlay):
+            start = item.start
+            if start is None: start = 0
+            if end is None or item.step is not None or end-start != len(val):
+                raise ValueError("StrPatchwork with overlay cannot change the length of %r" % item)
+            if not isinstance(val, bytes):
+                val = bytes(bytearray(val))
+            # Only one modification, that can be undone
+            if l < start:
+                val = self.paddingbyte*(start-l) + val
+                start = l
+            self.s.write(start, val)
+            return
         if l < end:
-            self.s.extend(array("B", self.paddingbyte*(end-l)))
+            self.s.extend(self.paddingbyte*(end-l))
         self.s[item] = val
-        self.s_cache = None
 
 
     def __repr__(self):
-        return "<Patchwork %r>" % self.s.tostring()
+        return "<Patchwork %r>" % self.pack()
     def __len__(self):
         return len(self.s)
     def __contains__(self, val):
-        return val in self.pack()
+        return self.s.find(val) != -1
     def __iadd__(self, other):
-        self.s.extend(array("B", other))
+        self._detach_views(len(self.s))
+        self._writable().extend(other)
+        self.version += 1
         return self
 
     def find(self, pattern, *args):
-        if not self.s_cache:
-            self.s_cache = self.s.tostring()
-        return self.s_cache.find(pattern, *args)
+        return self.s.find(pattern, *args)
 
     def rfind(self, pattern, *args):
-        if not self.s_cache:
-            self.s_cache = self.s.tostring()
-        return self.s_cache.rfind(pattern, *args)
+        return self.s.rfind(pattern, *args)
+
+    # Only with a PatchOverlay
+    def _overlay(self):
+        if not isinstance(self.s, PatchOverlay):
+            raise ValueError("StrPatchwork without overlay has no patches")
+        return self.s
+    def patches(self):
+        """ List of (offset, data) of the modifications, sorted """
+        return self._overlay().patches()
+    def diff(self):
+        """ List of (offset, old data, new data) of the modifications;
+        old data is shorter than new data when the content was extended """
+        return self._overlay().diff()
+    def undo(self):
+        """ Cancels the last modification """
+        overlay = self._overlay()
+        self._detach_views(*overlay.undo_extent())
+        overlay.undo()
+        self.version += 1
@@ -186,7 +186,9 @@ def display_symbols(e, table_name):
     if not table_name in e.sh.__dict__:
         print("Symbol table '.%s' missing" % table_name)
         return
-    print(e.sh.__dict__[table_name].readelf_display())
+    # Lines are printed as they are generated, even for large tables
+    for line in e.sh.__dict__[table_name].readelf_lines():
+        print(line)
 
 
 
@@ -214,7 +216,8 @@ if __name__ == '__main__':
         if 'headers' in args.options:
             display_headers(e)
         if 'sections' in args.options:
-            print(e.sh.readelf_display())
+            for line in e.sh.readelf_lines():
+                print(line)
         if 'reltab' in args.options:
             # Same output as readelf -r
             for sh in e.sh:
@@ -29,6 +29,8 @@ class print_colored(object): # Namespace
 
 for name in (
         'visual_studio_mangling',
+        'cstruct',
+        'intervals',
         'pe_manipulation',
         'elf_manipulation',
         'rprc_manipulation',
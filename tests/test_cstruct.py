@@ -0,0 +1,175 @@
+#! /usr/bin/env python
+
+import os
+__dir__ = os.path.dirname(__file__)
+
+def run_test():
+    ko = []
+    def assertion(target, value, message):
+        if target != value: ko.append(message)
+    import struct
+    from elfesteem.cstruct import CArray, CString
+    from elfesteem.strpatchwork import pack_parts
+    class Parent(object):
+        sex = '<'
+        wsize = 32
+    class Names(CArray):
+        _cls = CString
+        count = lambda _: 2
+    a = Names(parent=Parent(), content='ab\0cd\0'.encode('latin1'))
+    a[0].set_value('abc'.encode('latin1'))
+    assertion('abc\0cd\0'.encode('latin1'), a.pack(),
+              'CArray, pack after an element changed size')
+    assertion(a.pack(), pack_parts([(0, a)]),
+              'CArray, pack_into after an element changed size')
+    # Layouts, computed once for each class, endianess and wordsize
+    from elfesteem.cstruct import CStruct
+    class Pair(CStruct):
+        _fields = [ ("a","u16"), ("b","ptr") ]
+    class Triple(Pair):
+        _fields = [ ("a","u16"), ("b","ptr"), ("c","u08") ]
+    x = Pair(parent=Parent(), content='\1\0\2\0\0\0'.encode('latin1'))
+    y = Pair(parent=Parent(), a=3)
+    assertion(True, x._layout is y._layout and
+                    x._layout is Pair._get_layout('<', 32),
+              'CStruct layout, shared by the objects of a class')
+    assertion(['<HI', '>HI', '<HQ', '<HIB'],
+              [Pair._get_layout('<', 32).packstring,
+               Pair._get_layout('>', 32).packstring,
+               Pair._get_layout('<', 64).packstring,
+               Triple._get_layout('<', 32).packstring],
+              'CStruct layout, for each endianess, wordsize and class')
+    assertion(((1, 2), (3, 0), '<HI'),
+              ((x.a, x.b), (y.a, y.b), x._packstring),
+              'CStruct layout, unpacked values and default values')
+    assertion([('<', 32), ('<', 64), ('>', 32)], sorted(Pair._layouts),
+              'CStruct layout, cache of the class')
+    # CArray of fixed-size elements, decoded in bulk; the elements are
+    # only created when they are accessed. Compared with the decoding
+    # element by element, used when the class redefines unpack.
+    class SlowPair(Pair):
+        def unpack(self, c, o):
+            CStruct.unpack(self, c, o)
+    class Pairs(CArray):
+        _cls = Pair
+        count = lambda _: 4
+    class SlowPairs(Pairs):
+        _cls = SlowPair
+    d = struct.pack('<HIHIHIHI', 1, 2, 3, 4, 5, 6, 7, 8)
+    fast = Pairs(parent=Parent(), content=d)
+    slow = SlowPairs(parent=Parent(), content=d)
+    assertion((True, None), (fast._values is not None, slow._values),
+              'CArray, bulk decoding only for plain classes')
+    assertion([None]*4, fast._elts,
+              'CArray, elements not created by bulk decoding')
+    assertion(([5, 3], 4, d), ([fast[2].a, fast[-3].a], len(fast), fast.pack()),
+              'CArray, element access after bulk decoding')
+    assertion([None, fast[1], fast[2], None], fast._elts,
+              'CArray, only the accessed elements are created')
+    assertion([(e.a, e.b) for e in slow], [(e.a, e.b) for e in fast],
+              'CArray, bulk decoding and element by element')
+    fast[0].b = 9
+    slow[0].b = 9
+    assertion(slow.pack(), fast.pack(),
+              'CArray, pack after changing one element')
+    assertion(d[:2] + struct.pack('<I', 9) + d[6:], fast.pack(),
+              'CArray, pack after changing one element, content')
+    assertion([(e.a, e.b) for e in slow._array], [(e.a, e.b) for e in fast._array],
+              'CArray, all elements created')
+    fast = Pairs(parent=Parent(), content=d[:-3])
+    slow = SlowPairs(parent=Parent(), content=d[:-3])
+    assertion([(e.a, e.b) for e in slow], [(e.a, e.b) for e in fast],
+              'CArray, bulk decoding of a truncated content')
+    # new_cstruct: unpacking with the plans compiled for each class,
+    # compared with a field by field decoding, as it was done before
+    import re
+    from elfesteem import new_cstruct
+    from elfesteem.new_cstruct import CStruct, type_size, real_fmt
+    class NcHead(CStruct):
+        _fields = [("a", "u16"),
+                   ("b", "u08"),
+                   ("p", "ptr")]
+    class NcItem(CStruct):
+        _fields = [("x", "u32"),
+                   ("name", "sz")]
+    def get_pascal(c, s, of):
+        l = struct.unpack('B', s[of:of+1])[0]
+        return s[of+1:of+1+l], of+1+l
+    def set_pascal(c, value):
+        return struct.pack('B', len(value)) + value
+    class NcAll(CStruct):
+        _fields = [("n", "u16"),
+                   ("m", "s32"),
+                   ("tag", "4s"),
+                   ("words", "u16", lambda c: c.n),
+                   ("tags", "2s", lambda c: 2),
+                   ("none", "u32", lambda c: 0),
+                   ("head", "NcHead"),
+                   ("items", "NcItem", lambda c: c.n),
+                   ("label", (get_pascal, set_pascal)),
+                   ("q", "u64"),
+                   ("f", "f")]
+    def generic_unpack(cls, s, of, sex, wsize):
+        c = cls(_sex=sex, _wsize=wsize)
+        for field in cls._fields:
+            fname, ffmt, cpt = (field + (None,))[:3]
+            if ffmt in type_size or (isinstance(ffmt, str)
+                                     and re.match(r'\d+s', ffmt)):
+                fmt = c.sex + real_fmt(ffmt, wsize)
+                l = struct.calcsize(fmt)
+                if cpt:
+                    value = []
+                    for _ in range(cpt(c)):
+                        value.append(struct.unpack(fmt, s[of:of+l])[0])
+                        of += l
+                else:
+                    value = struct.unpack(fmt, s[of:of+l])[0]
+                    of += l
+            elif ffmt == "sz":
+                end = s.find(struct.pack('B', 0), of)
+                value, of = s[of:end], end+1
+            elif ffmt in new_cstruct.all_cstructs:
+                sub = new_cstruct.all_cstructs[ffmt]
+                if cpt:
+                    value = []
+                    for _ in range(cpt(c)):
+                        v, of = generic_unpack(sub, s, of, sex, wsize)
+                        value.append(v)
+                else:
+                    value, of = generic_unpack(sub, s, of, sex, wsize)
+            else:
+                value, of = ffmt[0](c, s, of)
+            setattr(c, CStruct._prefix+fname, value)
+        return c, of
+    def fields(c):
+        if isinstance(c, list):
+            return [fields(_) for _ in c]
+        if not isinstance(c, CStruct):
+            return c
+        return [(f[0], fields(getattr(c, f[0]))) for f in c._fields]
+    for sex, wsize in ((0, 32), (1, 32), (0, 64), (1, 64)):
+        o = NcAll(_sex=sex, _wsize=wsize)
+        p = {32: 'I', 64: 'Q'}
+        fmt = o.sex
+        s = struct.pack(fmt+'Hi4s', 2, -5, 'abcd'.encode('latin1')) \
+          + struct.pack(fmt+'HH', 7, 8) + 'efgh'.encode('latin1') \
+          + struct.pack(fmt+'HB'+p[wsize], 1, 2, 3) \
+          + struct.pack(fmt+'I', 9) + 'one\0'.encode('latin1') \
+          + struct.pack(fmt+'I', 10) + 'two\0'.encode('latin1') \
+          + struct.pack('B', 3) + 'xyz'.encode('latin1') \
+          + struct.pack(fmt+'Qf', 1<<40, 0.5) + 'tail'.encode('latin1')
+        c, l = NcAll.unpack_l(s, 0, None, sex, wsize)
+        r, end = generic_unpack(NcAll, s, 0, sex, wsize)
+        assertion((fields(r), end), (fields(c), l),
+                  'new_cstruct, unpack plan, sex %d wsize %d' % (sex, wsize))
+        assertion(s[:l], c.pack(),
+                  'new_cstruct, pack after unpack, sex %d wsize %d' % (sex, wsize))
+    return ko
+
+if __name__ == "__main__":
+    ko = run_test()
+    if ko:
+        for k in ko:
+            print('Non-regression failure for %r'%k)
+    else:
+        print('OK')
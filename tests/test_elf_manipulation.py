@@ -56,6 +56,17 @@ def run_test():
     assertion('dc3f17080d002ba0bfb3aec9f3bec8b2',
               hashlib.md5(d).hexdigest(),
               'Creation of an ELF with a given list of sections')
+    s = e.getsectionbyname('.strtab')
+    assertion({'.text': 5, 'text': 6, '.rel.text': 1, '': 0},
+              s.build(['.text', 'text', '.rel.text', '']),
+              'Build a string table, with tail merging')
+    assertion('\0.rel.text\0'.encode('latin1'), s.content.pack(),
+              'Content of a string table, with tail merging')
+    assertion((6, 11), (s.add_name('text'), s.add_name('data')),
+              'Add names to a string table')
+    s.content[1] = '_'
+    assertion('_rel.text', s.get_name(1),
+              'Get name after modification of a string table')
     try:
         e = ELF(open(__dir__+'/binary_input/README.txt', 'rb').read())
         ko.append('Not an ELF')
@@ -71,8 +82,26 @@ def run_test():
     assertion('ab4b1e52e7532789592878872910a2a1',
               hashlib.md5(d).hexdigest(),
               'Display Program Headers')
+    assertion([['.ctors', '.dtors', '.jcr', '.dynamic', '.got', '.got.plt',
+                '.data', '.bss'], [],
+               ['.ctors', '.dtors', '.jcr', '.dynamic', '.got']],
+              [[s.sh.name for s in e.ph[i].shlist] for i in (3, 7, 8)],
+              'Section to Segment mapping')
+    import binascii
+    from elfesteem.elf_init import build_id
+    assertion([(elf.NT_GNU_ABI_TAG, 16), (elf.NT_GNU_BUILD_ID, 20)],
+              [(t, len(d)) for t, n, d in e.ph[5].iter_notes()],
+              'Notes in PT_NOTE segment')
+    assertion([(elf.NT_GNU_BUILD_ID, struct.pack('4s', 'GNU'.encode('latin1')))],
+              [(t, n) for t, n, d in e.getsectionbyname('.note.gnu.build-id').notes],
+              'Notes in SHT_NOTE section')
+    assertion('ba1b94406f645e539fed678f49c0f015c3fe5b17',
+              binascii.hexlify(e.build_id()).decode('latin1'),
+              'Build ID')
+    assertion(e.build_id(), build_id(elf_small),
+              'Build ID, without parsing the file')
     d = repr(e.sh).encode('latin1')
-    assertion('ddf01165114eb70bd27910e4c5b03c09',
+    assertion('fd99caf2c2a7b579bb12986a91e87c99',
               hashlib.md5(d).hexdigest(),
               'Display Section Headers (repr)')
     d = e.sh.readelf_display().encode('latin1')
@@ -89,6 +118,83 @@ def run_test():
     assertion('000002: 00000000    0 FUNC    GLOBAL DEFAULT  UND __stack_chk_fail',
               e.getsectionbyname('.dynsym')[2].readelf_display(),
               'Get symbol by index, found')
+    # Symbols decoded while iterating are kept, unless they are displayed
+    s = ELF(elf_small).getsectionbyname('.symtab')
+    s.readelf_display()
+    assertion([None]*len(s.symtab), s.symtab._elts,
+              'Symbols displayed are not kept')
+    for sym in s.symtab:
+        sym.value = 0x1234
+    assertion([0x1234]*len(s.symtab), [_.value for _ in s.symtab],
+              'Symbols modified while iterating')
+    assertion(struct.pack('<I', 0x1234), s.symtab[20].pack()[4:8],
+              'Symbol modified while iterating, packed')
+    assertion('000007: 0804a01c    4 OBJECT  GLOBAL DEFAULT   25 stdin',
+              e.getsectionbyname('.dynsym').lookup('stdin').readelf_display(),
+              'Get symbol with .gnu.hash, found')
+    assertion(None,
+              e.getsectionbyname('.dynsym').lookup('puts'),
+              'Get symbol with .gnu.hash, undefined symbol')
+    assertion(None,
+              e.getsectionbyname('.dynsym').lookup('no_such_symbol'),
+              'Get symbol with .gnu.hash, not found')
+    assertion((e.getsectionbyname('.gnu.hash'),),
+              e.getsectionbyname('.dynsym')._hash,
+              'Hash table of a symbol table, found once')
+    # 'stdin' made undefined, it stays in the hashed range of .gnu.hash
+    off = e.getsectionbyname('.dynsym').sh.offset + 7*16 + 14
+    d = elf_small[:off] + struct.pack('<H', elf.SHN_UNDEF) + elf_small[off+2:]
+    assertion(None,
+              ELF(d).getsectionbyname('.dynsym').lookup('stdin'),
+              'Get symbol with .gnu.hash, undefined symbol in hashed range')
+    # Same, without .gnu.hash (its type is changed)
+    off = e.Ehdr.shoff + 4*e.Ehdr.shentsize + 4
+    d = d[:off] + struct.pack('<I', elf.SHT_PROGBITS) + d[off+4:]
+    assertion(None,
+              ELF(d).getsectionbyname('.dynsym').lookup('stdin'),
+              'Get symbol without hash table, undefined symbol')
+    assertion('000006: 080485ac    4 OBJECT  GLOBAL DEFAULT   15 _IO_stdin_used',
+              ELF(d).getsectionbyname('.dynsym').lookup('_IO_stdin_used').readelf_display(),
+              'Get symbol without hash table, found')
+    v = e.dynamic_view()
+    assertion(['libc.so.6'], v.needed,
+              'Dynamic segment, needed libraries')
+    assertion(len(e.getsectionbyname('.dynsym').symtab), len(v.dynsym.symtab),
+              'Dynamic segment, number of symbols given by .gnu.hash')
+    assertion(['fgets', '__stack_chk_fail', 'puts', '__gmon_start__',
+               '__libc_start_main'],
+              [r.sym for r in v.jmprel.reltab],
+              'Dynamic segment, PLT relocations')
+    # Without section header table
+    d = elf_small[:32] + struct.pack('<I', 0) + elf_small[36:48] \
+      + struct.pack('<HH', 0, 0) + elf_small[52:]
+    log.setLevel(logging.CRITICAL)
+    v = ELF(d).dynamic_view()
+    log.setLevel(logging.ERROR)
+    assertion('000007: 0804a01c    4 OBJECT  GLOBAL DEFAULT   25 stdin',
+              v.lookup('stdin').readelf_display(),
+              'Dynamic segment without sections, get symbol')
+    from elfesteem.elf_init import Symbolizer
+    z = Symbolizer(e)
+    assertion(('main', 5, e.getsectionbyname('.text')),
+              z.lookup(0x8048489),
+              'Symbolize an address in a function')
+    assertion((None, 3, e.getsectionbyname('.plt')),
+              z.lookup(0x8048373),
+              'Symbolize an address in a section without symbol')
+    assertion([('stdin@@GLIBC_2.0', 0, e.getsectionbyname('.bss')),
+               None, ('main', 5, e.getsectionbyname('.text'))],
+              z.lookup_many([0x804a01c, 0x8048000, 0x8048489]),
+              'Symbolize a batch of addresses')
+    # Same symbol, with another section index: only their sections differ
+    f = ELF(elf_small)
+    s = f.getsectionbyname('.symtab')
+    sym = elf.Sym32(parent=s, content=s['main'].pack())
+    sym.shndx = 16
+    s[len(s.symtab)] = sym
+    assertion(('main', 5, f.getsectionbyname('.text')),
+              Symbolizer(f).lookup(0x8048489),
+              'Symbolize an address, duplicated symbol')
     d = e.getsectionbyname('.text').pack()
     assertion('7149c6e4b8baaab8beebfeb818585638',
               hashlib.md5(d).hexdigest(),
@@ -150,6 +256,54 @@ def run_test():
               hashlib.md5(d).hexdigest(),
               'Packing after reading elf64_small.out')
     # Packed file is identical :-)
+    e = ELF.from_path(__dir__+'/binary_input/elf64_small.out')
+    d = e.pack()
+    assertion('dc21d928bb6a3a0fa59b17fafe803d50',
+              hashlib.md5(d).hexdigest(),
+              'Packing after mapping elf64_small.out in memory')
+    e.content[0x10] = struct.pack('<H', elf.ET_DYN)
+    assertion([(0x10, struct.pack('<H', elf.ET_DYN))], e.content.patches(),
+              'Patch of a file mapped in memory')
+    d = struct.pack('<HH', elf.ET_DYN, elf.EM_X86_64)
+    assertion((0x10, 0x10, -1, 0),
+              (e.content.find(d), e.content.rfind(d),
+               e.content.find(elf64_small[0x10:0x14]),
+               e.content.rfind(elf64_small[:4], 0, 0x12)),
+              'Search in a file mapped in memory, with a patch')
+    e.content.undo()
+    assertion(elf64_small, e.content.pack(),
+              'Undo patch of a file mapped in memory')
+    # Section and segment headers are decoded when they are used, or
+    # before the file content is modified
+    f = ELF.from_path(__dir__+'/binary_input/elf64_small.out')
+    assertion((elf.EM_X86_64, None, None), (f.Ehdr.machine, f._sh, f._ph),
+              'Headers not decoded when a file is opened')
+    t = e.getsectionbyname('.text').sh
+    f.content[t.offset] = struct.pack('B', 0xcc)
+    assertion(elf64_small[t.offset:t.offset+t.size],
+              f.getsectionbyname('.text').pack(),
+              'Headers decoded before the file content is modified')
+    assertion(repr(e.ph), repr(f.ph),
+              'Segment headers decoded with the section headers')
+    # Sections view the file content until it is modified where they are
+    from elfesteem.strpatchwork import ContentView
+    t = e.getsectionbyname('.text')
+    d = t.pack()
+    e.content[t.sh.offset] = struct.pack('B', 0xcc)
+    assertion(d, t.pack(),
+              'Section not modified by a write in the file content')
+    assertion(True, isinstance(e.getsectionbyname('.data').content.s,
+                               ContentView),
+              'Section not copied by a write elsewhere in the file content')
+    s = e.getsectionbyname('.strtab')
+    assertion(('main', True), (s.get_name(s.content.find(
+              'main\0'.encode('latin1'))), isinstance(s.content.s, ContentView)),
+              'Name read in a string table, without copying it')
+    e.content.undo()
+    d = bytearray(2+e.sh.bytelen)
+    e.sh.pack_into(d, 2)
+    assertion(e.sh.pack(), bytes(d[2:]),
+              'Section headers written in place in a buffer')
     d = e.sh.readelf_display().encode('latin1')
     assertion('6d4aa86afdbf612430cb699987bc22b9',
               hashlib.md5(d).hexdigest(),
@@ -158,10 +312,104 @@ def run_test():
     assertion('f51c09394daa3d77a872d514b7fac72d',
               hashlib.md5(d).hexdigest(),
               'Display Symbol Table (elf64)')
+    s = e.getsectionbyname('.symtab')
+    assertion(s.readelf_display().split('\n'), list(s.readelf_lines()),
+              'Display Symbol Table (elf64), line by line')
+    assertion(s.symtab[20].readelf_display(), list(s.readelf_lines())[22],
+              'Index of a symbol decoded while iterating')
+    assertion(28, e.getsectionbyname('.symtab').sh.idx,
+              'Index of a section')
+    try:
+        import numpy
+    except ImportError:
+        # NumPy is optional
+        numpy = None
+    if numpy is not None:
+        a = s.as_array()
+        assertion([(_.value, _.size, _.info, _.shndx) for _ in s.symtab],
+                  [tuple(map(int, _)) for _ in a[['value','size','info','shndx']]],
+                  'Symbol Table as a NumPy array (elf64)')
+        f = a[(a['info'] == (elf.STB_GLOBAL<<4)|elf.STT_FUNC) & (a['size'] > 40)]
+        assertion(['__libc_csu_init', 'main'],
+                  [s.linksection.get_name(_) for _ in f['name_idx']],
+                  'Filter symbols in a NumPy array (elf64)')
+        r = e.getsectionbyname('.rela.dyn')
+        assertion([(_.offset, _.sym_idx, _.type, _.addend) for _ in r.reltab],
+                  [(int(_['offset']), int(_['info'])>>32,
+                    int(_['info'])&0xffffffff, int(_['addend']))
+                   for _ in r.as_array()],
+                  'Reloc Table as a NumPy array (elf64)')
     d = e.getsectionbyname('.rela.dyn').readelf_display().encode('latin1')
     assertion('650cf3f99117d39d63fae73232e09acf',
               hashlib.md5(d).hexdigest(),
               'Display Reloc Table (elf64)')
+    assertion(['stdin'],
+              [_.sym for _ in e.getsectionbyname('.rela.dyn').getrelocsbyoffset(0x601050)],
+              'Reloc at an offset, in a Reloc Table (elf64)')
+    assertion(['__gmon_start__', 'puts', '__stack_chk_fail', '__libc_start_main'],
+              [_.sym for _ in e.getrelocsbyoffset(0x600ff8, 0x601030)],
+              'Relocs in a range of offsets, in all Reloc Tables (elf64)')
+    assertion([], e.getrelocsbyoffset(0x601000),
+              'No reloc at an offset (elf64)')
+    # One field of a table, decoded by blocks; the last entry is truncated
+    from elfesteem.elf_init import table_field
+    layout = elf.Rela64._get_layout('<', 64)
+    data = struct.pack('<' + 'QQq4x'*2500, *[ i for idx in range(2500)
+                       for i in (idx*8, idx, -idx) ])[:-12]
+    assertion(([ idx*8 for idx in range(2500) ],
+               [ -idx for idx in range(2499) ] + [0]),
+              (table_field(data, '<', layout, 'offset', 28, 2500),
+               table_field(data, '<', layout, 'addend', 28, 2500)),
+              'One field of a table, decoded by blocks')
+    # Sections are parsed when their parsed attributes are first read
+    e = ELF(elf64_small)
+    parsed = lambda: [ s.sh.name for s in e.sh
+                       if [k for k in s._parsed if k in s.__dict__] ]
+    assertion([], parsed(),
+              'No section parsed when the file is read (elf64)')
+    r = e.getsectionbyname('.rela.dyn').reltab
+    assertion(['.rela.dyn'], parsed(),
+              'Only the section read is parsed (elf64)')
+    assertion('__gmon_start__', r[0].sym,
+              'Symbol of a reloc, before the symbol table is parsed (elf64)')
+    assertion(['.dynsym', '.rela.dyn'], parsed(),
+              'Symbol table parsed when a symbol name is read (elf64)')
+    assertion([], e.sh.parse_all(),
+              'Parse all sections (elf64)')
+    # Each section is parsed after the ones it depends on, even when they
+    # come later in the list, e.g. .gnu.hash (4) is linked to .dynsym (5)
+    e = ELF(elf64_small)
+    order = []
+    def record(s):
+        def parse():
+            order.append(s.sh.idx)
+            return s.__class__.parse(s)
+        return parse
+    for s in e.sh:
+        s.parse = record(s)
+    e.sh.parse_all()
+    assertion(sorted(range(len(e.sh.shlist))), sorted(order),
+              'Parse all sections, each one once (elf64)')
+    assertion([], [ (s.sh.idx, dep) for s in e.sh for dep in s.dependencies()
+                    if order.index(dep) > order.index(s.sh.idx) ],
+              'Parse all sections, after their dependencies (elf64)')
+    assertion(True, order.index(5) < order.index(4),
+              'Parse all sections, dependency later in the list (elf64)')
+    e = ELF(elf64_small)
+    s1, s2 = e.getsectionbyname('.rela.dyn'), e.getsectionbyname('.rela.plt')
+    s1.sh.link, s2.sh.link = s2.sh.idx, s1.sh.idx
+    log.setLevel(logging.CRITICAL)
+    assertion([s1, s2], e.sh.parse_all(),
+              'Parse all sections, with a dependency cycle (elf64)')
+    log.setLevel(logging.ERROR)
+    s = e.getsectionbyname('.comment')
+    s.content[0] = struct.pack('B', 0x58)
+    assertion(elf64_small[s.sh.offset:s.sh.offset+2],
+              e[s.sh.offset:s.sh.offset+2],
+              'Section content copied when modified')
+    assertion(struct.pack('B', 0x58)+elf64_small[s.sh.offset+1:s.sh.offset+2],
+              e.pack()[s.sh.offset:s.sh.offset+2],
+              'Modified section content is packed')
     elf_group = open(__dir__+'/binary_input/elf_cpp.o', 'rb').read()
     assertion('57fed5de9474bc0600173a1db5ee6327',
               hashlib.md5(elf_group).hexdigest(),
@@ -190,6 +438,121 @@ def run_test():
     assertion('ecf169c765d29175177528e24601f1be',
               hashlib.md5(d).hexdigest(),
               'Display Section Headers (TMP320C6x)')
+    # Core file of a x86-64 process, with two segments; only the first
+    # 16 bytes of the first segment are dumped
+    from elfesteem.elf_init import CoreFile
+    def note(type, desc):
+        return struct.pack('<III', 5, len(desc), type) \
+             + 'CORE\0\0\0\0'.encode('latin1') + desc
+    notes = note(elf.NT_PRSTATUS,
+                 struct.pack('<iiiH2xQQiiii64x', 11, 0, 0, 11, 0, 0,
+                             1234, 1, 1234, 1234)
+               + struct.pack('<28Q', *([0]*16 + [0x400010] + [0]*11))) \
+          + note(elf.NT_FILE,
+                 struct.pack('<5Q', 1, 0x1000, 0x400000, 0x402000, 1)
+               + '/bin/true\0\0\0'.encode('latin1')) \
+          + note(elf.NT_AUXV,
+                 struct.pack('<4Q', elf.AT_PAGESZ, 0x1000, elf.AT_NULL, 0))
+    data_off = 64 + 3*56 + len(notes)
+    d = struct.pack('<16sHHIQQQIHHHHHH',
+            struct.pack('7B', 0x7f,0x45,0x4c,0x46, 2, 1, 1),
+            elf.ET_CORE, elf.EM_X86_64, 1, 0, 64, 0, 0, 64, 56, 3, 64, 0, 0) \
+      + struct.pack('<IIQQQQQQ', elf.PT_NOTE, 0, 64+3*56, 0, 0,
+                    len(notes), 0, 4) \
+      + struct.pack('<IIQQQQQQ', elf.PT_LOAD, 5, data_off, 0x400000, 0,
+                    16, 0x1000, 0x1000) \
+      + struct.pack('<IIQQQQQQ', elf.PT_LOAD, 5, data_off+16, 0x401000, 0,
+                    0, 0x1000, 0x1000) \
+      + notes + 'code'.encode('latin1')*4
+    e = ELF(d)
+    c = CoreFile(e)
+    assertion([(1234, 11, 0x400010)],
+              [(t.pid, t.cursig, t.regs['rip']) for t in c.threads],
+              'Core file, threads')
+    assertion([(0x400000, 0x402000, 0x1000, '/bin/true')], c.files,
+              'Core file, mapped files')
+    assertion(('/bin/true', 0x2004), c.mapped_file(0x401004),
+              'Core file, file mapped at an address')
+    assertion([(elf.AT_PAGESZ, 0x1000)], c.auxv,
+              'Core file, auxiliary vector')
+    assertion(('code'+'\0'*4).encode('latin1'), c.read(0x40000c, 8),
+              'Core file, read memory partially dumped')
+    assertion(c.read(0x40000c, 8), e.virt[0x40000c:0x400014],
+              'Core file, read memory partially dumped with virt')
+    assertion(('\0'*8).encode('latin1'), c[0x400ffc:0x401004],
+              'Core file, read memory across segments')
+    try:
+        c.read(0x401ffc, 8)
+        ko.append('Core file, read memory not mapped')
+    except ValueError:
+        pass
+    from elfesteem.strpatchwork import ContentView
+    v = c.view(0x400004, 8)
+    assertion((True, 'codecode'.encode('latin1')),
+              (isinstance(v, ContentView), v[:]),
+              'Core file, view of the memory in the file')
+    try:
+        c.view(0x40000c, 8)
+        ko.append('Core file, view of memory partially dumped')
+    except ValueError:
+        pass
+    # Line numbers from .debug_line, units in DWARF 3, 4 and 5
+    from elfesteem.dwarf import DebugLine
+    e = ELF(open(__dir__+'/binary_input/elf64_debug_line.out', 'rb').read())
+    d = DebugLine(e)
+    assertion([3, 4, 5], [unit.version for unit in d.units],
+              'DWARF line tables, versions')
+    assertion(33, len(d),
+              'DWARF line tables, number of rows')
+    assertion([None, ('a.c', 4), ('b.c', 7), ('/tmp/dw/main.c', 9), None],
+              [d.lookup(ad) for ad in (0x1128,0x112c,0x1149,0x116f,0x1170)],
+              'DWARF line tables, lookup')
+    import io
+    f = io.BytesIO()
+    d.save(f, e.build_id())
+    f.seek(0)
+    c = DebugLine.load(f, e.build_id())
+    assertion([ list(u.rows()) for u in d.units ],
+              [ list(u.rows()) for u in c.units ],
+              'DWARF line tables, saved and loaded')
+    assertion(d.lookup(0x1149), c.lookup(0x1149),
+              'DWARF line tables, lookup after load')
+    f.seek(0)
+    assertion(None, DebugLine.load(f, 'other'.encode('latin1')),
+              'DWARF line tables, load with another key')
+    f.seek(0)
+    c = DebugLine.load(f)
+    assertion(d.lookup(0x1149), c is not None and c.lookup(0x1149),
+              'DWARF line tables, load without key')
+    # Overlapping sequences, as made by --gc-sections; the address of
+    # the last one is given with only 4 bytes
+    from elfesteem.dwarf import LineTable
+    def set_address(ad, fmt='<Q'):
+        return struct.pack('<BBB', 0, 1+struct.calcsize(fmt), 2) \
+             + struct.pack(fmt, ad)
+    prog = set_address(0) + struct.pack('<BBBBB', 3, 9, 1, 2, 0x80) \
+         + struct.pack('<BBBB', 2, 0, 1, 1) \
+         + set_address(0) + struct.pack('<BBBBB', 3, 19, 1, 2, 4) \
+         + struct.pack('<BBB', 0, 1, 1) \
+         + set_address(0x2000, '<I') + struct.pack('<BBBBB', 3, 29, 1, 2, 8) \
+         + struct.pack('<BBB', 0, 1, 1)
+    header = struct.pack('<BBbBB', 1, 1, -5, 14, 10) \
+           + struct.pack('<9B', 0, 1, 1, 1, 1, 0, 0, 0, 1) \
+           + '\0a.c\0\0\0\0\0'.encode('latin1')
+    unit = struct.pack('<HI', 2, len(header)) + header + prog
+    unit = struct.pack('<I', len(unit)) + unit
+    t, end = LineTable.decode(bytearray(unit), 0, '<', 64)
+    assertion([(0, 4), (0, 0x100), (0x2000, 0x2008)], t.sequences,
+              'DWARF line tables, overlapping sequences')
+    assertion([('a.c', 10), ('a.c', 10), None, ('a.c', 30), None],
+              [t.lookup(ad) for ad in (2, 0x10, 0x100, 0x2004, 0x2008)],
+              'DWARF line tables, lookup in overlapping sequences')
+    # Padding between and after the units
+    d = DebugLine()
+    d.decode_units(bytearray(unit + struct.pack('<4I', 0, 0, 0, 0) + unit
+                             + struct.pack('<7B', 0, 0, 0, 0, 1, 2, 3)))
+    assertion((2, ('a.c', 30)), (len(d.units), d.lookup(0x2004)),
+              'DWARF line tables, padding skipped')
     return ko
 
 if __name__ == "__main__":
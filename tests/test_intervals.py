@@ -0,0 +1,71 @@
+#! /usr/bin/env python
+
+def run_test():
+    ko = []
+    def assertion(target, value, message):
+        if target != value: ko.append(message)
+    from elfesteem.intervals import Intervals
+    # As used by MACHO: the whole file, then the parsed parts are deleted;
+    # adjacent, overlapping and empty deletions. The expected values are
+    # the ones of the previous implementation, which did not merge the
+    # ranges around an empty deletion and kept empty ranges in inverses.
+    i = Intervals().add(0, 100)
+    for start, stop in ((10, 20), (20, 30), (25, 40), (50, 50), (60, 70),
+                        (65, 68), (95, 100), (0, 5)):
+        i.delete(start, stop)
+    assertion([(5, 10), (40, 60), (70, 95)], list(i.iter_ranges()),
+              'Intervals, ranges after deletions')
+    assertion([slice(5, 10), slice(40, 60), slice(70, 95)], i.ranges,
+              'Intervals, ranges as slices')
+    assertion('[5:10] [40:60] [70:95]', str(i),
+              'Intervals, display')
+    assertion(list(range(5, 10)) + list(range(40, 60)) + list(range(70, 95)),
+              list(i),
+              'Intervals, iteration on the integers')
+    for start, stop, gaps in ((0, 100, [(0, 5), (10, 40), (60, 70), (95, 100)]),
+                              (0, 5, [(0, 5)]),
+                              (5, 10, []),
+                              (40, 60, []),
+                              (30, 30, []),
+                              (45, 55, []),
+                              (90, 120, [(95, 120)])):
+        assertion(gaps, list(i.gaps(start, stop)),
+                  'Intervals, gaps in [%d:%d]' % (start, stop))
+    assertion([False, False, True, True, True, True, False],
+              [i.contains(0, 100), i.contains(0, 5), i.contains(5, 10),
+               i.contains(40, 60), i.contains(45, 55), i.contains(70, 95),
+               i.contains(90, 120)],
+              'Intervals, contains')
+    assertion([False, True, False, True, True, False],
+              [i.excludes(0, 100), i.excludes(0, 5), i.excludes(5, 10),
+               i.excludes(30, 30), i.excludes(60, 70), i.excludes(90, 120)],
+              'Intervals, excludes')
+    # Additions: adjacent, overlapping, empty and disjoint ranges
+    i = Intervals()
+    assertion([], list(i.gaps(3, 3)) + list(i.iter_ranges()),
+              'Intervals, empty set')
+    assertion([(3, 8)], list(i.gaps(3, 8)),
+              'Intervals, gaps of the empty set')
+    i.add(0, 10).add(10, 20)
+    assertion([(0, 20)], list(i.iter_ranges()),
+              'Intervals, add adjacent range')
+    i.add(5, 15).add(15, 30).add(40, 40)
+    assertion([(0, 30)], list(i.iter_ranges()),
+              'Intervals, add overlapping and empty ranges')
+    i.add(35, 38).add(-8, -3)
+    assertion([(-8, -3), (0, 30), (35, 38)], list(i.iter_ranges()),
+              'Intervals, add disjoint ranges')
+    assertion([(-3, 0), (30, 35), (38, 40)], list(i.gaps(-5, 40)),
+              'Intervals, gaps after additions')
+    i.add(-3, 36)
+    assertion([(-8, 38)], list(i.iter_ranges()),
+              'Intervals, add range that merges all')
+    return ko
+
+if __name__ == "__main__":
+    ko = run_test()
+    if ko:
+        for k in ko:
+            print('Non-regression failure for %r'%k)
+    else:
+        print('OK')